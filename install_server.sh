@@ -62,6 +62,17 @@ source venv/bin/activate
 pip install --upgrade pip
 pip install -r requirements-server.txt
 
+# Optional: compile server/timing_core.py with mypyc (falls back to pure Python if skipped/failing)
+if [ "${STONETIMER_MYPYC:-0}" = "1" ]; then
+    echo "Compiling timing core with mypyc..."
+    apt-get install -y build-essential python3-dev
+    pip install mypy
+    (cd "${INSTALL_DIR}/server" && python -m mypyc timing_core.py) \
+        || echo "WARNING: mypyc build failed; using pure-Python timing_core"
+else
+    rm -f "${INSTALL_DIR}"/server/timing_core.*.so
+fi
+
 echo "[4/5] Copying configuration file..."
 if [ ! -f ${INSTALL_DIR}/config.yaml ]; then
     cp ${INSTALL_DIR}/configs/config-pi4-hog-close.yaml ${INSTALL_DIR}/config.yaml
@@ -5,36 +5,103 @@ Runs on Pi Zero 2 W at the tee line and the far hog line.
 Monitors the light sensor and sends timestamps over UDP.
 """
 
+import os
 import socket
+import struct
 import time
 import json
-import yaml
 import logging
 import signal
 import sys
+import queue
+import select
 import threading
 from pathlib import Path
 from typing import Optional
 
-# Try importing gpiozero
+# Try importing gpiod (libgpiod v2). Edge events are read straight from the
+# line request fd in the main thread - no callback thread in between.
 try:
-    from gpiozero import Button
-    from gpiozero.pins.lgpio import LGPIOFactory
-    from gpiozero import Device
-    Device.pin_factory = LGPIOFactory()
+    import gpiod
+    from gpiod.line import Bias, Direction, Edge
+    FALLING_EDGE = gpiod.EdgeEvent.Type.FALLING_EDGE
     GPIO_AVAILABLE = True
 except ImportError:
     GPIO_AVAILABLE = False
-    print("WARNING: gpiozero not available, running in simulation mode")
+    print("WARNING: gpiod not available, running in simulation mode")
 
 # Config path
 CONFIG_PATH = Path(__file__).parent.parent / "config.yaml"
 
+# Binary wire format (little-endian): type tag, device index, timestamp_ns,
+# mono_ns. The device index is the position in DEVICE_IDS and must match
+# server/main.py.
+FRAME = struct.Struct('<BBQQ')
+MSG_TRIGGER = 1
+MSG_HEARTBEAT = 2
+DEVICE_IDS = ('tee', 'hog_close', 'hog_far')
+
+# Trigger bursts go out as one datagram: type tag, device index, count, the
+# first (timestamp_ns, mono_ns) entry, then for each further trigger the
+# deltas to the previous one as two zigzag varints.
+MSG_TRIGGER_BATCH = 3
+BATCH_HEADER = struct.Struct('<BBH')
+BATCH_ENTRY = struct.Struct('<QQ')
+BATCH_MAX = 16
+VARINT_MAX = 10  # bytes for a 64-bit value
+
+
+def _put_varint(buf: bytearray, pos: int, value: int) -> int:
+    """Write a signed value as a zigzag LEB128 varint at pos; return the new pos."""
+    value = (value << 1) ^ (value >> 63)
+    while value >= 0x80:
+        buf[pos] = (value & 0x7F) | 0x80
+        value >>= 7
+        pos += 1
+    buf[pos] = value
+    return pos + 1
+
+# Local clock that NTP never steps; sent next to the wall-clock timestamp so
+# the server can spot clock steps on the sensor. This is also the clock the
+# kernel stamps GPIO edge events with.
+MONO_CLOCK = time.CLOCK_MONOTONIC
+
+GPIO_CHIP = '/dev/gpiochip0'
+
+
+class _FastFormatter(logging.Formatter):
+    """Formats like '%(asctime)s - %(name)s - %(levelname)s - %(message)s'.
+
+    The date/time part only changes once a second, so it is cached instead of
+    running strftime for every record.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._sec = -1
+        self._sec_str = ''
+
+    def format(self, record: logging.LogRecord) -> str:
+        sec = int(record.created)
+        if sec != self._sec:
+            self._sec = sec
+            self._sec_str = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sec))
+        line = (f"{self._sec_str},{int(record.msecs):03d} - {record.name} - "
+                f"{record.levelname} - {record.getMessage()}")
+        if record.exc_info:
+            line = f"{line}\n{self.formatException(record.exc_info)}"
+        return line
+
+
 # Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(_FastFormatter())
+logging.basicConfig(level=logging.INFO, handlers=[_log_handler])
+# Skip per-record lookups the format never uses (caller frame, thread, process)
+logging._srcfile = None
+logging.logThreads = False
+logging.logProcesses = False
+logging.logMultiprocessing = False
 logger = logging.getLogger('stonetimer-sensor')
 
 
@@ -56,31 +123,149 @@ class SensorDaemon:
     def __init__(self, config_path: Path = CONFIG_PATH):
         self.config = self._load_config(config_path)
         self.device_id = self.config['device_id']  # "tee" or "hog_far"
+        if self.device_id not in DEVICE_IDS:
+            raise ValueError(f"Unknown device_id: {self.device_id}")
+        self._dev_idx = DEVICE_IDS.index(self.device_id)
         self.running = True
-        self.sensor_button = None  # gpiozero Button for the sensor
-        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._stop_evt = threading.Event()
+        self._line_request = None  # gpiod line request for the sensor pin
+        self._debounce_ns = 0
+        self._pending_edge_ns: Optional[int] = None  # beam break not yet debounce_ns long
+        # Trigger log lines are written by a background thread so logging I/O
+        # never sits between timestamp capture and the UDP send.
+        self._log_q: queue.SimpleQueue = queue.SimpleQueue()
+        self._log_thread: Optional[threading.Thread] = None
+        self._all_cpus: Optional[set[int]] = None  # CPU mask before _set_realtime pinned us
+        self._trig_log_msg = f"TRIGGER! {self.device_id} (%d)"
+        # Captured triggers waiting for the sender thread (BATCH_ENTRY records)
+        self._ring = bytearray(BATCH_ENTRY.size * BATCH_MAX)
+        self._ring_mv = memoryview(self._ring)
+        self._ring_count = 0
+        self._ring_cond = threading.Condition()
+        self._sender_thread: Optional[threading.Thread] = None
+        # Reusable send buffers: a single trigger frame is its type/device header
+        # followed by one ring entry, so sending it is a copy, not a new bytes.
+        self._trig_buf = bytearray(FRAME.size)
+        self._trig_mv = memoryview(self._trig_buf)
+        self._trig_buf[0] = MSG_TRIGGER
+        self._trig_buf[1] = self._dev_idx
+        self._hb_buf = bytearray(FRAME.size)
+        self._batch_hdr = bytearray(BATCH_HEADER.size)
+        self._batch_deltas = bytearray(2 * VARINT_MAX * (BATCH_MAX - 1))
+        self._batch_deltas_mv = memoryview(self._batch_deltas)
         
-        # UDP socket
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.server_address = (
+        # UDP socket. Non-blocking: a full send buffer drops a datagram instead of
+        # stalling the sender; CLOEXEC keeps the fd out of any child process.
+        self.udp_socket = socket.socket(
+            socket.AF_INET,
+            socket.SOCK_DGRAM | socket.SOCK_NONBLOCK | socket.SOCK_CLOEXEC
+        )
+        # Resolve the server once; store the numeric (ip, port) so nothing on the
+        # send path ever needs a name lookup.
+        infos = socket.getaddrinfo(
             self.config['server']['host'],
-            self.config['server']['port']
+            int(self.config['server']['port']),
+            socket.AF_INET,
+            socket.SOCK_DGRAM,
+            0,
+            socket.AI_NUMERICSERV
         )
+        self.server_address = infos[0][4]
+        # Connected UDP: the destination is fixed once, so each send skips address handling
+        self.udp_socket.connect(self.server_address)
+        self._tune_socket()
 
         # Heartbeat interval (seconds). Allows the server UI to show which sensors are alive.
         self.heartbeat_interval_s = float(self.config.get('server', {}).get('heartbeat_interval_s', 5.0))
+
+        # Wire format: "binary" (compact struct frame, default) or "json" (readable, for debugging)
+        self.wire_format = str(self.config.get('server', {}).get('wire_format', 'binary'))
+        # JSON payloads are precompiled; only the timestamp changes per message.
+        device_json = json.dumps(self.device_id)
+        self._trig_json_tmpl = (
+            '{"type": "trigger", "device_id": %s, "timestamp_ns": %%d, "ts_mono_ns": %%d}' % device_json
+        ).encode('utf-8')
+        self._hb_json_tmpl = (
+            '{"type": "heartbeat", "device_id": %s, "timestamp_ns": %%d, "ts_mono_ns": %%d}' % device_json
+        ).encode('utf-8')
         
         logger.info(f"Sensor: {self.device_id}")
         logger.info(f"Server: {self.server_address}")
+        logger.info(f"Wire format: {self.wire_format}")
         logger.info(f"Heartbeat interval: {self.heartbeat_interval_s:.1f}s")
         
+    def _tune_socket(self):
+        """Best-effort: mark trigger traffic as high priority (EF) on the host and Wi-Fi."""
+        options = [
+            (socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20),
+            (socket.SOL_SOCKET, getattr(socket, 'SO_PRIORITY', None), 6),
+            (socket.IPPROTO_IP, socket.IP_TOS, 0xB8),
+        ]
+        for level, option, value in options:
+            if option is None:
+                continue
+            try:
+                self.udp_socket.setsockopt(level, option, value)
+            except OSError as e:
+                logger.warning(f"Could not set socket option {option}: {e}")
+
+    def _set_realtime(self):
+        """Best-effort: real-time priority and a dedicated core for the trigger path.
+
+        The trigger sender thread inherits both; the log writer drops back to
+        normal scheduling on all CPUs (see _log_drain).
+        Needs root/CAP_SYS_NICE; without it the daemon runs with normal scheduling.
+        """
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(20))
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Could not set SCHED_FIFO: {e}")
+        try:
+            cpus = os.sched_getaffinity(0)
+            if len(cpus) > 1:
+                os.sched_setaffinity(0, {max(cpus)})
+                self._all_cpus = cpus
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Could not set CPU affinity: {e}")
+
     def _load_config(self, config_path: Path) -> dict:
-        """Load configuration from YAML file."""
+        """Load configuration from YAML file.
+
+        The parsed config is cached as JSON next to the YAML file, keyed by its
+        mtime and size, so a restart with an unchanged config never imports PyYAML.
+        Configs that JSON can't represent exactly are not cached.
+        """
         if not config_path.exists():
             raise FileNotFoundError(f"Config file missing: {config_path}")
         
+        st = config_path.stat()
+        key = [st.st_mtime_ns, st.st_size]
+        cache_path = config_path.with_name(config_path.name + '.cache.json')
+        try:
+            cached = json.loads(cache_path.read_text(encoding='utf-8'))
+            if cached.get('key') == key:
+                return cached['config']
+        except Exception:
+            pass
+        
+        import yaml  # only needed when the cache is missing or stale
         with open(config_path, 'r') as f:
-            return yaml.safe_load(f)
+            config = yaml.safe_load(f)
+        
+        try:
+            data = json.dumps({'key': key, 'config': config})
+        except TypeError:
+            return config  # not JSON-serialisable (e.g. dates): no cache
+        # Only cache configs that round-trip unchanged (int keys would come back as str)
+        if json.loads(data)['config'] != config:
+            return config
+        try:
+            tmp = cache_path.with_suffix('.tmp')
+            tmp.write_text(data, encoding='utf-8')
+            tmp.replace(cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write config cache: {e}")
+        return config
     
     def _setup_gpio(self):
         """Configure GPIO for the light sensor."""
@@ -90,67 +275,185 @@ class SensorDaemon:
         
         try:
             pin = self.config['gpio']['sensor_pin']
-            debounce_s = self.config['gpio']['debounce_ms'] / 1000.0
+            debounce_ms = self.config['gpio']['debounce_ms']
             
-            self.sensor_button = Button(
-                pin,
-                pull_up=True,
-                bounce_time=debounce_s
+            # LM393 DO goes LOW when the beam is blocked, internal pull-up. Both
+            # edges: a rising edge inside the debounce window cancels the break.
+            self._line_request = gpiod.request_lines(
+                GPIO_CHIP,
+                consumer='stonetimer-sensor',
+                config={
+                    pin: gpiod.LineSettings(
+                        direction=Direction.INPUT,
+                        edge_detection=Edge.BOTH,
+                        bias=Bias.PULL_UP
+                    )
+                }
             )
-            self.sensor_button.when_pressed = self._sensor_triggered
+            self._debounce_ns = int(debounce_ms * 1_000_000)
             
-            logger.info(f"GPIO {pin} configured with debounce {debounce_s*1000:.0f}ms")
+            logger.info(f"GPIO {pin} configured with debounce {debounce_ms:.0f}ms")
             
         except Exception as e:
             logger.error(f"GPIO error: {e}")
             logger.warning("Continuing without GPIO")
     
-    def _sensor_triggered(self):
-        """Callback when the sensor triggers (laser beam breaks)."""
-        # Capture timestamp immediately
-        trigger_time = time.time_ns()
-        
-        logger.info(f"TRIGGER! {self.device_id}")
+    def _cleanup_gpio(self):
+        """Release the GPIO line request."""
+        if self._line_request is not None:
+            self._line_request.release()
+            self._line_request = None
+    
+    def _read_edges(self):
+        """Handle pending edge events on the sensor line (fd is readable)."""
+        for event in self._line_request.read_edge_events():
+            # Stability filter on the kernel timestamps: a beam break counts only
+            # once the line has stayed low for debounce_ns, and is then stamped
+            # with its leading edge. Deliberately not LineSettings(debounce_period=...):
+            # the kernel stamps debounced events when the period expires (from a
+            # workqueue), which would add scheduling jitter to every measurement.
+            if event.event_type == FALLING_EDGE:
+                if self._pending_edge_ns is None:
+                    self._pending_edge_ns = event.timestamp_ns
+            elif self._pending_edge_ns is not None:
+                # Beam back: shorter than debounce_ns is a glitch or bounce
+                if event.timestamp_ns - self._pending_edge_ns >= self._debounce_ns:
+                    self._sensor_triggered(self._pending_edge_ns)
+                self._pending_edge_ns = None
+    
+    def _check_pending_edge(self) -> Optional[float]:
+        """Commit a beam break that has stayed low for debounce_ns.
+
+        Returns the seconds until a still-pending break is due, None if none is.
+        """
+        pending = self._pending_edge_ns
+        if pending is None:
+            return None
+        remaining_ns = pending + self._debounce_ns - time.clock_gettime_ns(MONO_CLOCK)
+        if remaining_ns > 0:
+            return remaining_ns / 1_000_000_000
+        self._pending_edge_ns = None
+        self._sensor_triggered(pending)
+        return None
+    
+    def _sensor_triggered(self, edge_mono_ns: Optional[int] = None):
+        """Called when the sensor triggers (laser beam breaks).
+
+        edge_mono_ns is the kernel's MONO_CLOCK timestamp of the GPIO edge; the
+        wall-clock time of the edge is derived from it, so read latency does
+        not end up in the measurement.
+        """
+        # Capture timestamps immediately (monotonic first, then wall clock)
+        now_mono = time.clock_gettime_ns(MONO_CLOCK)
+        now_wall = time.time_ns()
+        if edge_mono_ns is None:
+            trigger_mono, trigger_time = now_mono, now_wall
+        else:
+            trigger_mono = edge_mono_ns
+            trigger_time = now_wall - (now_mono - edge_mono_ns)
         
-        # Send via UDP - server decides whether to act on it
-        payload = {
-            'type': 'trigger',
-            'device_id': self.device_id,
-            'timestamp_ns': trigger_time
-        }
+        # Hand over to the sender thread - server decides whether to act on it
+        with self._ring_cond:
+            if self._ring_count == BATCH_MAX:
+                logger.warning("Trigger buffer full, dropping trigger")
+                return
+            BATCH_ENTRY.pack_into(
+                self._ring, self._ring_count * BATCH_ENTRY.size, trigger_time, trigger_mono
+            )
+            self._ring_count += 1
+            self._ring_cond.notify()
         
+        self._log_q.put_nowait(trigger_time)
+
+    def _encode_triggers(self, count: int) -> list[list]:
+        """Encode the first count buffered triggers as datagrams, each a list of buffers.
+
+        Buffers may point into the ring, so send them before releasing the ring lock.
+        """
+        if self.wire_format == 'json':
+            return [
+                [self._trig_json_tmpl % BATCH_ENTRY.unpack_from(self._ring, i * BATCH_ENTRY.size)]
+                for i in range(count)
+            ]
+        if count == 1:
+            self._trig_mv[2:] = self._ring_mv[:BATCH_ENTRY.size]
+            return [[self._trig_buf]]
+        # Header, first entry and deltas are gathered by sendmsg - no concatenated copy.
+        # Sub-second deltas take 1-5 bytes instead of 8.
+        BATCH_HEADER.pack_into(self._batch_hdr, 0, MSG_TRIGGER_BATCH, self._dev_idx, count)
+        prev_time, prev_mono = BATCH_ENTRY.unpack_from(self._ring, 0)
+        pos = 0
+        for i in range(1, count):
+            trigger_time, trigger_mono = BATCH_ENTRY.unpack_from(self._ring, i * BATCH_ENTRY.size)
+            pos = _put_varint(self._batch_deltas, pos, trigger_time - prev_time)
+            pos = _put_varint(self._batch_deltas, pos, trigger_mono - prev_mono)
+            prev_time, prev_mono = trigger_time, trigger_mono
+        return [[self._batch_hdr, self._ring_mv[:BATCH_ENTRY.size], self._batch_deltas_mv[:pos]]]
+
+    def _send_triggers(self):
+        """Send buffered triggers, one datagram per wakeup (runs in its own thread).
+
+        Sends as soon as a trigger is buffered; only triggers that queued up while
+        the sender was busy go out together as a batch.
+        """
+        while True:
+            with self._ring_cond:
+                while self._ring_count == 0:
+                    self._ring_cond.wait()
+                # The socket is non-blocking, so sending under the lock never
+                # holds up the edge reader for more than a syscall.
+                for buffers in self._encode_triggers(self._ring_count):
+                    try:
+                        self.udp_socket.sendmsg(buffers)
+                    except ConnectionRefusedError:
+                        # Connected UDP reports ICMP port unreachable (server not up yet)
+                        logger.warning("Could not send UDP: server not listening")
+                    except BlockingIOError:
+                        logger.warning("Could not send UDP: send buffer full, trigger dropped")
+                    except Exception as e:
+                        logger.error(f"Could not send UDP: {e}")
+                self._ring_count = 0
+
+    def _log_drain(self):
+        """Write queued trigger log lines (runs in its own thread)."""
+        # Logging must never compete with the edge reader or the sender
+        try:
+            os.sched_setscheduler(0, os.SCHED_OTHER, os.sched_param(0))
+            if self._all_cpus is not None:
+                os.sched_setaffinity(0, self._all_cpus)
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Could not reset log thread scheduling: {e}")
+        while True:
+            trigger_time = self._log_q.get()
+            logger.info(self._trig_log_msg, trigger_time)
+
+    def _send_heartbeat(self, signum=None, frame=None):
+        """Send a heartbeat to the server (also the SIGALRM handler)."""
         try:
-            data = json.dumps(payload).encode('utf-8')
-            self.udp_socket.sendto(data, self.server_address)
+            hb_mono = time.clock_gettime_ns(MONO_CLOCK)
+            hb_time = time.time_ns()
+            if self.wire_format == 'json':
+                data = self._hb_json_tmpl % (hb_time, hb_mono)
+            else:
+                FRAME.pack_into(self._hb_buf, 0, MSG_HEARTBEAT, self._dev_idx, hb_time, hb_mono)
+                data = self._hb_buf
+            self.udp_socket.send(data)
+        except ConnectionRefusedError:
+            logger.warning("Could not send heartbeat UDP: server not listening")
+        except BlockingIOError:
+            logger.warning("Could not send heartbeat UDP: send buffer full")
         except Exception as e:
-            logger.error(f"Could not send UDP: {e}")
-
-    def _send_heartbeat(self):
-        """Send periodic heartbeats to the server."""
-        # Send one immediately on startup.
-        next_send = 0.0
-        while self.running:
-            now = time.time()
-            if now >= next_send:
-                payload = {
-                    'type': 'heartbeat',
-                    'device_id': self.device_id,
-                    'timestamp_ns': time.time_ns()
-                }
-                try:
-                    data = json.dumps(payload).encode('utf-8')
-                    self.udp_socket.sendto(data, self.server_address)
-                except Exception as e:
-                    logger.error(f"Could not send heartbeat UDP: {e}")
-                next_send = now + self.heartbeat_interval_s
-            time.sleep(0.2)
+            logger.error(f"Could not send heartbeat UDP: {e}")
     
     def _signal_handler(self, signum, frame):
         """Handle shutdown signals."""
         logger.info("Shutting down...")
         self.running = False
+        self._stop_evt.set()
+        # Stop heartbeats before the socket goes away
+        signal.setitimer(signal.ITIMER_REAL, 0)
         self.udp_socket.close()
-        # gpiozero hanterar cleanup automatiskt
+        self._cleanup_gpio()
         sys.exit(0)
     
     def run(self):
@@ -158,17 +461,38 @@ class SensorDaemon:
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
         
+        self._set_realtime()
+        
+        self._log_thread = threading.Thread(target=self._log_drain, daemon=True)
+        self._log_thread.start()
+        self._sender_thread = threading.Thread(target=self._send_triggers, daemon=True)
+        self._sender_thread.start()
+        
         self._setup_gpio()
         
         logger.info("Sensor daemon started - sending triggers to server")
 
-        # Heartbeat thread (daemon so process can exit cleanly)
-        self._heartbeat_thread = threading.Thread(target=self._send_heartbeat, daemon=True)
-        self._heartbeat_thread.start()
+        # Heartbeats come from an interval timer, so nothing wakes up in between.
+        # ITIMER_REAL runs on the kernel's monotonic time base, so clock steps
+        # do not shift the schedule. Send one immediately on startup.
+        self._send_heartbeat()
+        signal.signal(signal.SIGALRM, self._send_heartbeat)
+        signal.setitimer(signal.ITIMER_REAL, self.heartbeat_interval_s, self.heartbeat_interval_s)
+        
+        if self._line_request is None:
+            # Simulation mode: sleep until a shutdown signal
+            self._stop_evt.wait()
+            return
         
-        # Keep the process alive
-        while self.running:
-            time.sleep(1)
+        # Wait for edge events on the line request fd
+        poller = select.epoll()
+        poller.register(self._line_request.fd, select.EPOLLIN)
+        timeout = None
+        while not self._stop_evt.is_set():
+            # Wake up when a pending beam break has been stable for debounce_ns
+            if poller.poll(-1 if timeout is None else timeout):
+                self._read_edges()
+            timeout = self._check_pending_edge()
 
 
 def main():
@@ -6,21 +6,28 @@ Collects timestamps, calculates times, and serves the web UI.
 """
 
 import asyncio
+import ctypes
+import errno
 import socket
+import struct
 import json
 import time
 import os
-import yaml
+import re
+import signal
 import logging
-import threading
 import subprocess
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from itertools import islice
 from pathlib import Path
 from typing import Optional
 from contextlib import asynccontextmanager
 from enum import Enum
-from dataclasses import dataclass
+
+from timing_core import TimingSession
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request
 from fastapi.staticfiles import StaticFiles
@@ -38,9 +45,163 @@ except ImportError:
     GPIO_AVAILABLE = False
     print("WARNING: gpiozero not available, running in simulation mode")
 
+# libgpiod v2 for the local timing sensor: kernel edge timestamps, read from
+# the event loop (same approach as the sensor daemon). Falls back to gpiozero.
+try:
+    import gpiod
+    from gpiod.line import Bias, Direction, Edge
+    FALLING_EDGE = gpiod.EdgeEvent.Type.FALLING_EDGE
+    GPIOD_AVAILABLE = True
+except ImportError:
+    GPIOD_AVAILABLE = False
+
+# orjson encodes/decodes in C; stdlib json is the fallback
+try:
+    import orjson
+    
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+    
+    json_dumps_bytes = orjson.dumps
+    json_loads = orjson.loads
+except ImportError:
+    json_dumps = json.dumps
+    json_loads = json.loads
+    
+    def json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
 # Config path
 CONFIG_PATH = Path(__file__).parent.parent / "config.yaml"
 RUNTIME_SETTINGS_PATH = Path(__file__).parent.parent / "runtime_settings.json"
+GPIO_CHIP = '/dev/gpiochip0'
+# Measurement log, one JSON record per line. A record is appended again when it
+# is updated (later lines win) and {"id": N, "deleted": true} marks a deletion.
+HISTORY_PATH = Path(__file__).parent.parent / "history.ndjson"
+
+# Linux SO_BUSY_POLL (not exported by the socket module): poll the NIC for this
+# many microseconds on receive instead of waiting for the softirq wakeup
+SO_BUSY_POLL = 46
+UDP_BUSY_POLL_US = 50
+# SO_RCVBUFFORCE (root only) may exceed net.core.rmem_max; also not exported
+SO_RCVBUFFORCE = 33
+UDP_RCVBUF = 4 * 1024 * 1024
+
+# Audio cache built by install_server.sh; speak.sh plays phrases/<key>.raw directly
+PIPER_CACHE_DIR = Path('/opt/piper/cache')
+
+# Spoken hundredths, as the UI shows them: "3.10" -> "3 point 10",
+# "3.06" -> "3 point oh 6", "3.00" -> "3 point 00"
+SPOKEN_HUNDREDTHS = {
+    f"{i:02d}": f"oh {i}" if 0 < i < 10 else f"{i:02d}"
+    for i in range(100)
+}
+
+# Pending utterances; on overflow the oldest is dropped
+TTS_QUEUE_MAX = 4
+
+# Measurements kept in memory (config: max_history)
+HISTORY_MAX = 100
+
+# Pending outbound messages per WebSocket client; on overflow the oldest is
+# dropped, since each state_update supersedes the previous one.
+WS_QUEUE_MAX = 4
+# A client that takes longer than this to accept one message is dropped
+WS_SEND_TIMEOUT_S = 1.0
+# State changes within this window (e.g. three sensors on a short stone path)
+# go out as one state_update
+BROADCAST_COALESCE_S = 0.005
+
+# Binary sensor frames (little-endian): type tag, device index, timestamp_ns,
+# mono_ns. Must match sensor/sensor_daemon.py.
+SENSOR_FRAME = struct.Struct('<BBQQ')
+MSG_TYPES = {1: 'trigger', 2: 'heartbeat'}
+DEVICE_IDS = ('tee', 'hog_close', 'hog_far')
+
+# Trigger bursts: type tag, device index, count, the first (timestamp_ns, mono_ns),
+# then per further trigger the two deltas to the previous one as zigzag varints.
+MSG_TRIGGER_BATCH = 3
+BATCH_HEADER = struct.Struct('<BBH')
+BATCH_ENTRY = struct.Struct('<QQ')
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    """Read a zigzag LEB128 varint at pos; return (value, new pos)."""
+    result = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:
+            return (result >> 1) ^ -(result & 1), pos
+        shift += 7
+
+
+class _SockaddrIn(ctypes.Structure):
+    _fields_ = [('sin_family', ctypes.c_ushort), ('sin_port', ctypes.c_ushort),
+                ('sin_addr', ctypes.c_ubyte * 4), ('sin_zero', ctypes.c_ubyte * 8)]
+
+
+class _IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint),
+                ('msg_iov', ctypes.POINTER(_IoVec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+class RecvMmsg:
+    """Receive up to n queued datagrams with one recvmmsg(2) call (Linux only)."""
+    
+    def __init__(self, n: int = 8, buflen: int = 1024):
+        recvmmsg = ctypes.CDLL(None, use_errno=True).recvmmsg  # AttributeError without it
+        recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint,
+                             ctypes.c_int, ctypes.c_void_p]
+        recvmmsg.restype = ctypes.c_int
+        self._recvmmsg = recvmmsg
+        self._bufs = [ctypes.create_string_buffer(buflen) for _ in range(n)]
+        self._addrs = (_SockaddrIn * n)()
+        self._iovs = (_IoVec * n)()
+        self._msgs = (_MMsgHdr * n)()
+        for i in range(n):
+            self._iovs[i].iov_base = ctypes.addressof(self._bufs[i])
+            self._iovs[i].iov_len = buflen
+            hdr = self._msgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._addrs[i])
+            hdr.msg_iov = ctypes.pointer(self._iovs[i])
+            hdr.msg_iovlen = 1
+    
+    def recv(self, fd: int) -> list[tuple[bytes, tuple[str, int]]]:
+        """Return [(data, (ip, port)), ...]; empty if nothing is queued."""
+        for m in self._msgs:
+            m.msg_hdr.msg_namelen = ctypes.sizeof(_SockaddrIn)
+        n = self._recvmmsg(fd, self._msgs, len(self._msgs), socket.MSG_DONTWAIT, None)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise OSError(err, os.strerror(err))
+        out = []
+        for i in range(n):
+            addr = self._addrs[i]
+            out.append((
+                ctypes.string_at(self._bufs[i], self._msgs[i].msg_len),
+                (socket.inet_ntoa(bytes(addr.sin_addr)), socket.ntohs(addr.sin_port))
+            ))
+        return out
+
+
+# A sensor's (wall - monotonic) offset moving more than this between two
+# messages means its wall clock was stepped (e.g. chrony makestep).
+CLOCK_STEP_WARN_NS = 50_000_000
 
 # Logging
 logging.basicConfig(
@@ -49,6 +210,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger('stonetimer-server')
 
+# CPU mask from before set_realtime() pinned the event loop (None = not pinned)
+_all_cpus: Optional[set[int]] = None
+
+
+def _unpin_thread():
+    """ThreadPoolExecutor initializer: run the worker on all CPUs, not the loop's core."""
+    if _all_cpus is not None:
+        try:
+            os.sched_setaffinity(0, _all_cpus)
+        except OSError as e:
+            logger.warning(f"Could not reset CPU affinity: {e}")
+
 
 class SystemState(str, Enum):
     IDLE = "idle"
@@ -57,69 +230,6 @@ class SystemState(str, Enum):
     COMPLETED = "completed"
 
 
-@dataclass
-class TimingRecord:
-    id: int
-    timestamp: datetime
-    tee_to_hog_close_ms: float
-    hog_to_hog_ms: Optional[float]  # None if the stone did not reach hog_far
-    total_ms: Optional[float]
-
-
-class TimingSession:
-    """Holds state for a measurement session."""
-    
-    def __init__(self):
-        self.reset()
-    
-    def reset(self):
-        self.tee_time_ns: Optional[int] = None
-        self.hog_close_time_ns: Optional[int] = None
-        self.hog_far_time_ns: Optional[int] = None
-        self.started_at: Optional[datetime] = None
-    
-    @property
-    def tee_to_hog_close_ms(self) -> Optional[float]:
-        if self.tee_time_ns and self.hog_close_time_ns:
-            return (self.hog_close_time_ns - self.tee_time_ns) / 1_000_000
-        return None
-    
-    @property
-    def hog_to_hog_ms(self) -> Optional[float]:
-        if self.hog_close_time_ns and self.hog_far_time_ns:
-            return (self.hog_far_time_ns - self.hog_close_time_ns) / 1_000_000
-        return None
-    
-    @property
-    def total_ms(self) -> Optional[float]:
-        if self.tee_time_ns and self.hog_far_time_ns:
-            return (self.hog_far_time_ns - self.tee_time_ns) / 1_000_000
-        return None
-    
-    @property
-    def has_hog_close(self) -> bool:
-        """True if the stone passed the near hog line."""
-        return self.tee_time_ns is not None and self.hog_close_time_ns is not None
-    
-    @property
-    def has_hog_far(self) -> bool:
-        """True om stenen passerat andra hog-linjen."""
-        return self.hog_far_time_ns is not None
-    
-    def to_dict(self) -> dict:
-        return {
-            'tee_time_ns': self.tee_time_ns,
-            'hog_close_time_ns': self.hog_close_time_ns,
-            'hog_far_time_ns': self.hog_far_time_ns,
-            'tee_to_hog_close_ms': self.tee_to_hog_close_ms,
-            'hog_to_hog_ms': self.hog_to_hog_ms,
-            'total_ms': self.total_ms,
-            'has_hog_close': self.has_hog_close,
-            'has_hog_far': self.has_hog_far,
-            'started_at': self.started_at.isoformat() if self.started_at else None
-        }
-
-
 class StoneTimerServer:
     """Main class for the StoneTimer server.
     
@@ -143,27 +253,69 @@ class StoneTimerServer:
     
     def __init__(self, config_path: Path = CONFIG_PATH):
         self.config = self._load_config(config_path)
+        server_cfg = self.config.get('server', {}) or {}
+        gpio_cfg = self.config.get('gpio', {}) or {}
+        # Config values used at runtime, read once
+        self.host: str = server_cfg['host']
+        self.http_port: int = int(server_cfg['http_port'])
+        self.udp_port: int = int(server_cfg['udp_port'])
+        self.auto_arm_on_start: bool = bool(server_cfg.get('auto_arm_on_start', False))
+        self.sensor_pin: Optional[int] = gpio_cfg.get('sensor_pin')
+        self.debounce_s: float = gpio_cfg.get('debounce_ms', 50) / 1000.0
+        self._sensor_lines = None  # gpiod line request for the timing sensor
+        self._pending_edge_ns: Optional[int] = None  # beam break not yet debounce_s long
+        self._edge_timer: Optional[asyncio.TimerHandle] = None
+        self.arm_pin: Optional[int] = gpio_cfg.get('arm_pin')
+        self.tts_debug_log: str = server_cfg.get('tts_debug_log', '/var/log/stonetimer-tts-spawn.log')
+        self._tts_env_cache: Optional[dict] = None
+        self._espeak_proc: Optional[subprocess.Popen] = None
+        # Utterances waiting for the TTS worker task (created in lifespan)
+        self._tts_queue: Optional[asyncio.Queue] = None
+        self._tts_task: Optional[asyncio.Task] = None
+        self._cached_phrases: set[str] = set()
+        self._tts_pids: set[int] = set()
+        self._tts_log_fd: Optional[int] = None
         self.state = SystemState.IDLE
         self.session = TimingSession()
-        self.websocket_clients: list[WebSocket] = []
+        # Map: websocket -> its outbound queue (drained by a per-client sender task)
+        self.websocket_clients: dict[WebSocket, asyncio.Queue] = {}
+        # Serialized state_update message; rebuilt only after the state changed
+        self._state_json: Optional[str] = None
+        self._state_dirty = True
+        # /api/status body and the state_message it was built alongside
+        self._status_json: bytes = b''
+        self._status_for: Optional[str] = None
+        self._last_broadcast: Optional[str] = None
+        self._broadcast_handle: Optional[asyncio.TimerHandle] = None
         self._loop = None  # Event loop reference, set when the server starts
 
         # Sensor liveness tracking (remote sensors send periodic heartbeats).
         # Map: device_id -> { last_seen_ts: float, addr: (ip, port), source: str }
         self.sensor_last_seen: dict[str, dict] = {}
-        self.sensor_timeout_s: float = float(self.config.get('server', {}).get('sensor_timeout_s', 12.0))
+        self.sensor_timeout_s: float = float(server_cfg.get('sensor_timeout_s', 12.0))
+        # /api/sensors entries, built once; only the volatile fields are rewritten.
+        # Always show these three sensors in the UI; hog_close is local on the Pi 4
+        # and doesn't send heartbeats, so it shows as "local" (neutral) until seen.
+        self._sensor_status: list[dict] = [
+            {'device_id': device_id, 'label': label,
+             'status': 'local' if device_id == 'hog_close' else 'offline',
+             'last_seen_s_ago': None, 'ip': None, 'source': None}
+            for device_id, label in (('tee', 'Tee'), ('hog_close', 'Hog near'), ('hog_far', 'Hog far'))
+        ]
+        # Map: device_id -> last seen (timestamp_ns - ts_mono_ns), for clock step detection
+        self._sensor_clock_offset: dict[str, int] = {}
         
         # Speech settings (runtime). Defaults come from config, but can be changed via /api/settings.
-        speech_cfg = self.config.get('server', {}).get('speech', {}) or {}
+        speech_cfg = server_cfg.get('speech', {}) or {}
         self.speech_settings = {
-            'speech_enabled': self.config['server'].get('enable_speech', False),
+            'speech_enabled': server_cfg.get('enable_speech', False),
             'speak_tee_hog': bool(speech_cfg.get('speak_tee_hog', True)),
             'speak_hog_hog': bool(speech_cfg.get('speak_hog_hog', False)),
             'speak_ready': bool(speech_cfg.get('speak_ready', True)),
         }
 
         # Auto-rearm settings (runtime). Used to recover if we get stuck in MEASURING.
-        auto_rearm_cfg = self.config.get('server', {}).get('auto_rearm', {}) or {}
+        auto_rearm_cfg = server_cfg.get('auto_rearm', {}) or {}
         self.speech_settings.update({
             # If enabled: after first trigger moves ARMED -> MEASURING, auto-arm back to ARMED
             # after N seconds, but only if we are still in MEASURING.
@@ -176,48 +328,87 @@ class StoneTimerServer:
         # Persisted runtime settings override (survives restarts even if config.yaml isn't edited).
         self._load_runtime_settings()
         
-        # In-memory history
-        self.history: list[TimingRecord] = []
+        # In-memory history, newest first (oldest records fall off the end).
+        # Records are kept in their API form: {id, timestamp, tee_to_hog_close_ms,
+        # hog_to_hog_ms, total_ms}; only the newest one is ever updated.
+        self.history: deque[dict] = deque(maxlen=max(1, int(self.config.get('max_history', HISTORY_MAX))))
+        # Encoded /api/times bodies per limit; cleared whenever the history changes
+        self._history_json: dict[int, bytes] = {}
         self._next_id = 1
+        # Lines in HISTORY_PATH, superseded and deleted ones included (drives compaction)
+        self._history_lines = 0
+        self._load_history()
+        # One writer thread keeps appends in order and off the measurement path
+        self._history_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='history',
+                                                  initializer=_unpin_thread)
+        self._history_closed = False
+        self._history_fp = None
         
         # UDP socket to receive triggers
         self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.udp_socket.bind(('0.0.0.0', self.config['server']['udp_port']))
+        self._tune_udp_socket()
+        self.udp_socket.bind(('0.0.0.0', self.udp_port))
+        self.udp_socket.setblocking(False)
+        
+        # Batched receive; falls back to plain recvfrom where recvmmsg is missing
+        try:
+            self._recv_mmsg: Optional[RecvMmsg] = RecvMmsg()
+        except (OSError, AttributeError):
+            self._recv_mmsg = None
+        self._udp_reader_fd: Optional[int] = None
         
-        self._udp_thread = None
-        self._running = False
+        logger.info(f"StoneTimer Server - UDP port {self.udp_port}")
+
+    def _tune_udp_socket(self):
+        """Best-effort: larger receive buffer for trigger bursts, busy polling on receive.
         
-        logger.info(f"StoneTimer Server - UDP port {self.config['server']['udp_port']}")
+        SO_RCVBUFFORCE and SO_BUSY_POLL need root/CAP_NET_ADMIN; without them the
+        buffer is capped at net.core.rmem_max and the socket otherwise works as before.
+        """
+        try:
+            self.udp_socket.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, UDP_RCVBUF)
+        except OSError:
+            self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF)
+        # The kernel reports double the usable size
+        rcvbuf = self.udp_socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // 2
+        if rcvbuf < UDP_RCVBUF:
+            logger.warning(f"UDP receive buffer is {rcvbuf // 1024} KiB (wanted {UDP_RCVBUF // 1024}); "
+                           f"raise it with: sysctl -w net.core.rmem_max={UDP_RCVBUF}")
+        else:
+            logger.info(f"UDP receive buffer: {rcvbuf // 1024} KiB")
+        try:
+            self.udp_socket.setsockopt(socket.SOL_SOCKET, SO_BUSY_POLL, UDP_BUSY_POLL_US)
+        except OSError as e:
+            logger.warning(f"Could not set SO_BUSY_POLL: {e}")
 
     def _tts_env(self) -> dict:
-        """Environment variables for TTS subprocesses.
+        """Environment variables for TTS subprocesses (built once).
 
         If you use the Pi 4 analog jack (bcm2835 Headphones), you typically want:
         ALSA_DEVICE=hw:0,0
         """
+        if self._tts_env_cache is not None:
+            return self._tts_env_cache
+        server_cfg = self.config.get('server', {}) or {}
         env = dict(os.environ)
         env.setdefault('HOME', '/root')
         # systemd units often set a very minimal PATH; make sure common tools exist for speak.sh
         env['PATH'] = env.get('PATH', '')
-        if env['PATH'].strip() == '' or env['PATH'] == self.config.get('server', {}).get('venv_path_only'):
-            pass
         if '/usr/bin' not in env['PATH']:
             env['PATH'] = f"/usr/bin:{env['PATH']}"
         if '/bin' not in env['PATH']:
             env['PATH'] = f"/bin:{env['PATH']}"
-        alsa_device = self.config.get('server', {}).get('alsa_device')
+        alsa_device = server_cfg.get('alsa_device')
         if alsa_device:
             env['ALSA_DEVICE'] = str(alsa_device)
         # Optional: only set ALSA_CARD if explicitly configured.
-        alsa_card = self.config.get('server', {}).get('alsa_card')
+        alsa_card = server_cfg.get('alsa_card')
         if alsa_card is not None:
             env['ALSA_CARD'] = str(alsa_card)
+        self._tts_env_cache = env
         return env
 
-    def _tts_debug_log_path(self) -> str:
-        return self.config.get('server', {}).get('tts_debug_log', '/var/log/stonetimer-tts-spawn.log')
-
     def _spawn_tts(self, text: str) -> None:
         """Spawn the TTS helper script and log spawn details for troubleshooting."""
         speak_script = '/opt/piper/speak.sh'
@@ -225,91 +416,304 @@ class StoneTimerServer:
             raise FileNotFoundError(speak_script)
 
         env = self._tts_env()
-        debug_log = self._tts_debug_log_path()
+        # Opened once; O_APPEND writes are unbuffered, so nothing needs flushing
+        fd = self._tts_log_fd
+        if fd is None:
+            fd = self._tts_log_fd = os.open(self.tts_debug_log,
+                                            os.O_WRONLY | os.O_APPEND | os.O_CREAT | os.O_CLOEXEC, 0o644)
         # Ensure we always capture something when troubleshooting.
-        with open(debug_log, 'a') as f:
-            f.write(f"{datetime.now().isoformat()} spawn speak.sh text={text!r} "
-                    f"ALSA_DEVICE={env.get('ALSA_DEVICE')!r} ALSA_CARD={env.get('ALSA_CARD')!r}\n")
-            f.flush()
-
-            # Send speak.sh stdout/stderr to the same file to catch ALSA/aplay errors.
-            subprocess.Popen(
-                [speak_script, text],
-                stdout=f,
-                stderr=f,
-                env=env,
-                start_new_session=True
-            )
+        os.write(fd, (f"{datetime.now().isoformat()} spawn speak.sh text={text!r} "
+                      f"ALSA_DEVICE={env.get('ALSA_DEVICE')!r} ALSA_CARD={env.get('ALSA_CARD')!r}\n").encode())
+
+        # Send speak.sh stdout/stderr to the same file to catch ALSA/aplay errors.
+        # posix_spawn skips Popen's bookkeeping; we reap the pid ourselves.
+        self._reap_tts()
+        pid = os.posix_spawn(
+            speak_script,
+            [speak_script, text],
+            env,
+            file_actions=[(os.POSIX_SPAWN_DUP2, fd, 1), (os.POSIX_SPAWN_DUP2, fd, 2)],
+            setsid=True
+        )
+        self._tts_pids.add(pid)
+    
+    def _reap_tts(self) -> None:
+        """Collect finished speak.sh children so they don't linger as zombies."""
+        for pid in list(self._tts_pids):
+            try:
+                done, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                done = pid
+            if done:
+                self._tts_pids.discard(pid)
+    
+    def _espeak(self, text: str) -> None:
+        """Speak via a long-lived espeak-ng process that reads one utterance per line.
+        
+        Started on first use and restarted if it died, so each utterance is a pipe
+        write instead of a fork/exec and voice load.
+        """
+        for _ in range(2):
+            proc = self._espeak_proc
+            if proc is None or proc.poll() is not None:
+                proc = self._espeak_proc = subprocess.Popen(
+                    ['/usr/bin/espeak-ng', '--stdin', '-v', 'en', '-s', '150'],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    env=self._tts_env()
+                )
+            try:
+                proc.stdin.write(f"{' '.join(text.split())}\n".encode('utf-8'))
+                proc.stdin.flush()
+                return
+            except BrokenPipeError:
+                self._espeak_proc = None
+        logger.warning("espeak-ng keeps exiting, utterance dropped")
+    
+    def close_tts(self) -> None:
+        proc, self._espeak_proc = self._espeak_proc, None
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+        # Stop speak.sh children still playing (each leads its own session) and reap them
+        self._reap_tts()
+        for pid in list(self._tts_pids):
+            try:
+                os.killpg(pid, signal.SIGTERM)
+            except OSError:
+                pass
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self._tts_pids.clear()
+        fd, self._tts_log_fd = self._tts_log_fd, None
+        if fd is not None:
+            os.close(fd)
     
     def _load_config(self, config_path: Path) -> dict:
+        """Load configuration from YAML file.
+        
+        The parsed config is cached as JSON next to the YAML file, keyed by its
+        mtime and size, so a restart with an unchanged config never imports PyYAML.
+        Configs that JSON can't represent exactly are not cached.
+        """
         if not config_path.exists():
             raise FileNotFoundError(f"Config file missing: {config_path}")
+        
+        st = config_path.stat()
+        key = [st.st_mtime_ns, st.st_size]
+        cache_path = config_path.with_name(config_path.name + '.cache.json')
+        try:
+            cached = json_loads(cache_path.read_bytes())
+            if cached.get('key') == key:
+                return cached['config']
+        except Exception:
+            pass
+        
+        import yaml  # only needed when the cache is missing or stale
+        # libyaml-backed loader when PyYAML was built with it
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
         with open(config_path, 'r') as f:
-            return yaml.safe_load(f)
+            config = yaml.load(f, Loader=loader)
+        
+        try:
+            data = json.dumps({'key': key, 'config': config})
+        except TypeError:
+            return config  # not JSON-serialisable (e.g. dates): no cache
+        # Only cache configs that round-trip unchanged (int keys would come back as str)
+        if json_loads(data)['config'] != config:
+            return config
+        try:
+            tmp = cache_path.with_suffix('.tmp')
+            tmp.write_text(data, encoding='utf-8')
+            tmp.replace(cache_path)
+        except OSError as e:
+            logger.warning(f"Could not write config cache: {e}")
+        return config
     
     def setup_gpio(self):
         """Configure GPIO for local sensors."""
+        if GPIOD_AVAILABLE and self.sensor_pin is not None:
+            self._setup_sensor_lines()
         if not GPIO_AVAILABLE:
-            logger.warning("GPIO not available - running without local sensors")
+            if self._sensor_lines is None:
+                logger.warning("GPIO not available - running without local sensors")
             return
         
         try:
-            # Hog close sensor (tidtagning)
-            sensor_pin = self.config['gpio']['sensor_pin']
-            debounce_s = self.config['gpio']['debounce_ms'] / 1000.0
-            
-            self.sensor_button = Button(
-                sensor_pin, 
-                pull_up=True, 
-                bounce_time=debounce_s
-            )
-            self.sensor_button.when_pressed = self._local_sensor_triggered
-            logger.info(f"Timing sensor on GPIO {sensor_pin}")
+            # Hog close sensor (tidtagning); gpiozero only if gpiod isn't usable
+            if self._sensor_lines is None:
+                self.sensor_button = Button(
+                    self.sensor_pin, 
+                    pull_up=True, 
+                    bounce_time=self.debounce_s
+                )
+                self.sensor_button.when_pressed = self._gpiozero_sensor_pressed
+                logger.info(f"Timing sensor on GPIO {self.sensor_pin}")
             
             # Arm sensor (IR) to arm the system
-            arm_pin = self.config['gpio'].get('arm_pin')
-            if arm_pin:
+            if self.arm_pin:
                 self.arm_button = Button(
-                    arm_pin, 
+                    self.arm_pin, 
                     pull_up=True, 
                     bounce_time=0.5
                 )
-                self.arm_button.when_pressed = self._arm_sensor_triggered
-                logger.info(f"Arm sensor (IR) on GPIO {arm_pin}")
+                self.arm_button.when_pressed = self._gpiozero_arm_pressed
+                logger.info(f"Arm sensor (IR) on GPIO {self.arm_pin}")
                 
         except Exception as e:
             logger.error(f"GPIO error: {e}")
             logger.warning("Continuing without local GPIO - using network sensors only")
     
-    def _local_sensor_triggered(self):
-        """Callback for local sensor (hog_close)."""
+    def _setup_sensor_lines(self):
+        """Request the timing sensor line for edge events and watch it from the event loop."""
+        try:
+            # Beam blocked pulls the line LOW (gpiozero's "pressed"), pull-up. Both
+            # edges: a rising edge inside the debounce window cancels the break.
+            self._sensor_lines = gpiod.request_lines(
+                GPIO_CHIP,
+                consumer='stonetimer-server',
+                config={
+                    self.sensor_pin: gpiod.LineSettings(
+                        direction=Direction.INPUT,
+                        edge_detection=Edge.BOTH,
+                        bias=Bias.PULL_UP
+                    )
+                }
+            )
+            self._loop.add_reader(self._sensor_lines.fd, self._read_sensor_edges)
+            logger.info(f"Timing sensor on GPIO {self.sensor_pin} (kernel edge timestamps)")
+        except Exception as e:
+            logger.warning(f"gpiod setup failed ({e}), falling back to gpiozero")
+            self.close_gpio()
+    
+    def close_gpio(self):
+        """Release the gpiod line request (gpiozero cleans up after itself)."""
+        lines, self._sensor_lines = self._sensor_lines, None
+        if self._edge_timer is not None:
+            self._edge_timer.cancel()
+            self._edge_timer = None
+        if lines is not None:
+            try:
+                self._loop.remove_reader(lines.fd)
+            except Exception:
+                pass
+            lines.release()
+    
+    def _read_sensor_edges(self):
+        """Handle pending edge events on the timing sensor line (fd is readable)."""
+        debounce_ns = int(self.debounce_s * 1_000_000_000)
+        for event in self._sensor_lines.read_edge_events():
+            # Stability filter on the kernel timestamps, as in the sensor daemon:
+            # a break counts once the line stayed low for debounce_s, stamped
+            # with its leading edge (like gpiozero's bounce_time, minus the delay)
+            if event.event_type == FALLING_EDGE:
+                if self._pending_edge_ns is None:
+                    self._pending_edge_ns = event.timestamp_ns
+            elif self._pending_edge_ns is not None:
+                # Beam back: shorter than debounce_s is a glitch or bounce
+                if event.timestamp_ns - self._pending_edge_ns >= debounce_ns:
+                    self._local_sensor_triggered(self._pending_edge_ns)
+                self._pending_edge_ns = None
+        if self._edge_timer is not None:
+            self._edge_timer.cancel()
+        self._check_pending_edge()
+    
+    def _check_pending_edge(self):
+        """Commit a beam break that has stayed low for debounce_s, or check back when due."""
+        self._edge_timer = None
+        pending = self._pending_edge_ns
+        if pending is None:
+            return
+        remaining_ns = pending + int(self.debounce_s * 1_000_000_000) - time.monotonic_ns()
+        if remaining_ns > 0:
+            self._edge_timer = self._loop.call_later(remaining_ns / 1_000_000_000, self._check_pending_edge)
+            return
+        self._pending_edge_ns = None
+        self._local_sensor_triggered(pending)
+    
+    def _local_sensor_triggered(self, edge_mono_ns: Optional[int] = None):
+        """Callback for local sensor (hog_close).
+        
+        edge_mono_ns is the CLOCK_MONOTONIC stamp of the edge: the kernel's (gpiod)
+        or the gpiozero callback's; without it the edge is stamped now.
+        Runs on the event loop, like all session and history updates.
+        """
+        # Splits are taken across devices, so the timestamp must be on the shared
+        # (chrony-synced) wall clock; the monotonic reading only detects steps of it.
+        now_mono = time.monotonic_ns()
         trigger_time = time.time_ns()
+        if edge_mono_ns is not None:
+            # Back-date to the edge so read latency stays out of the measurement
+            trigger_time -= now_mono - edge_mono_ns
+            now_mono = edge_mono_ns
+        self._check_clock_step('hog_close', trigger_time, now_mono)
         self._handle_trigger('hog_close', trigger_time)
     
+    def _gpiozero_sensor_pressed(self):
+        """gpiozero fallback callback (its own thread): stamp now, handle on the loop."""
+        self._call_in_loop(self._local_sensor_triggered, time.monotonic_ns())
+    
+    def _gpiozero_arm_pressed(self):
+        """gpiozero callback for the arm sensor (its own thread)."""
+        self._call_in_loop(self._arm_sensor_triggered)
+    
+    def _call_in_loop(self, callback, *args):
+        """Run callback on the event loop from another thread; dropped once the loop is gone."""
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except (AttributeError, RuntimeError):
+            logger.debug(f"Event loop not running, dropping {callback.__name__}")
+    
     def _arm_sensor_triggered(self):
         """Callback for arm sensor (IR)."""
         logger.info("Arm sensor triggered!")
         self.arm()
     
     def start_udp_listener(self):
-        """Start UDP listener in its own thread."""
-        self._running = True
-        self._udp_thread = threading.Thread(target=self._udp_listener_loop, daemon=True)
-        self._udp_thread.start()
+        """Watch the UDP socket from the event loop."""
+        self._udp_reader_fd = self.udp_socket.fileno()
+        self._loop.add_reader(self._udp_reader_fd, self._udp_read_ready)
         logger.info("UDP-lyssnare startad")
     
     def stop_udp_listener(self):
-        self._running = False
+        if self._udp_reader_fd is not None and self._loop:
+            self._loop.remove_reader(self._udp_reader_fd)
+            self._udp_reader_fd = None
         self.udp_socket.close()
     
-    def _udp_listener_loop(self):
-        """Listen for UDP messages."""
-        while self._running:
-            try:
-                data, addr = self.udp_socket.recvfrom(1024)
-                payload = json.loads(data.decode('utf-8'))
-                
+    def _udp_read_ready(self):
+        """Drain queued datagrams: up to 8 per recvmmsg call, the loop calls again if more remain."""
+        try:
+            if self._recv_mmsg is not None:
+                batch = self._recv_mmsg.recv(self._udp_reader_fd)
+            else:
+                batch = [self.udp_socket.recvfrom(1024)]
+        except BlockingIOError:
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSYS:
+                logger.warning("recvmmsg not supported, falling back to recvfrom")
+                self._recv_mmsg = None
+            else:
+                logger.warning(f"UDP error: {e}")
+            return
+        for data, addr in batch:
+            self._handle_datagram(data, addr)
+    
+    def _handle_datagram(self, data: bytes, addr):
+        """Handle one UDP datagram (runs on the event loop)."""
+        try:
+            # A datagram carries one message, or a burst of triggers
+            for payload in self._decode_datagram(data):
                 msg_type = payload.get('type')
+                if msg_type in ('trigger', 'heartbeat'):
+                    self._check_clock_step(
+                        payload.get('device_id'),
+                        payload.get('timestamp_ns'),
+                        payload.get('ts_mono_ns')
+                    )
                 if msg_type == 'trigger':
                     device_id = payload.get('device_id')
                     timestamp_ns = payload.get('timestamp_ns')
@@ -321,11 +725,77 @@ class StoneTimerServer:
                     device_id = payload.get('device_id')
                     if device_id:
                         self._mark_sensor_seen(device_id, addr, source='heartbeat')
-                        
-            except OSError:
-                break
-            except json.JSONDecodeError as e:
-                logger.error(f"Ogiltigt JSON: {e}")
+        except json.JSONDecodeError as e:
+            logger.error(f"Ogiltigt JSON: {e}")
+        except Exception as e:
+            # Runs as an event loop callback: never let one bad datagram escape
+            logger.error(f"Bad datagram from {addr}: {e!r}")
+
+    def _decode_datagram(self, data: bytes) -> list[dict]:
+        """Decode a sensor datagram (binary frame, trigger batch or JSON) into payload dicts."""
+        if data[:1] == b'{':
+            payload = json_loads(data)
+            if not isinstance(payload, dict):
+                logger.error(f"Invalid JSON message: {type(payload).__name__}")
+                return []
+            return [payload]
+        if data[:1] == bytes([MSG_TRIGGER_BATCH]) and len(data) >= BATCH_HEADER.size:
+            _, dev_idx, count = BATCH_HEADER.unpack_from(data)
+            try:
+                entries = self._decode_batch_entries(data, count)
+            except (IndexError, struct.error):
+                entries = None
+            if entries is None:
+                logger.error(f"Invalid batch length: {len(data)} for {count} triggers")
+                return []
+            msg_type = 'trigger'
+        elif len(data) == SENSOR_FRAME.size:
+            msg_tag, dev_idx, timestamp_ns, mono_ns = SENSOR_FRAME.unpack(data)
+            entries = [(timestamp_ns, mono_ns)]
+            msg_type = MSG_TYPES.get(msg_tag)
+        else:
+            logger.error(f"Invalid frame length: {len(data)}")
+            return []
+        if dev_idx >= len(DEVICE_IDS):
+            logger.error(f"Invalid device index: {dev_idx}")
+            return []
+        device_id = DEVICE_IDS[dev_idx]
+        return [
+            {
+                'type': msg_type,
+                'device_id': device_id,
+                'timestamp_ns': timestamp_ns,
+                'ts_mono_ns': mono_ns
+            }
+            for timestamp_ns, mono_ns in entries
+        ]
+
+    def _decode_batch_entries(self, data: bytes, count: int) -> Optional[list[tuple[int, int]]]:
+        """Decode the (timestamp_ns, mono_ns) entries of a batch frame; None if malformed."""
+        if count == 0:
+            return None
+        timestamp_ns, mono_ns = BATCH_ENTRY.unpack_from(data, BATCH_HEADER.size)
+        entries = [(timestamp_ns, mono_ns)]
+        pos = BATCH_HEADER.size + BATCH_ENTRY.size
+        for _ in range(count - 1):
+            delta_ns, pos = _read_varint(data, pos)
+            timestamp_ns += delta_ns
+            delta_ns, pos = _read_varint(data, pos)
+            mono_ns += delta_ns
+            entries.append((timestamp_ns, mono_ns))
+        if pos != len(data):
+            return None
+        return entries
+
+    def _check_clock_step(self, device_id: Optional[str], timestamp_ns: Optional[int], mono_ns: Optional[int]):
+        """Warn if a sensor's wall clock jumped relative to its monotonic clock."""
+        if not device_id or not timestamp_ns or not mono_ns:
+            return
+        offset = timestamp_ns - mono_ns
+        prev = self._sensor_clock_offset.get(device_id)
+        self._sensor_clock_offset[device_id] = offset
+        if prev is not None and abs(offset - prev) > CLOCK_STEP_WARN_NS:
+            logger.warning(f"Clock step on {device_id}: {(offset - prev) / 1_000_000:+.1f}ms")
 
     def _mark_sensor_seen(self, device_id: str, addr, source: str):
         """Record that a sensor was seen recently (heartbeat or trigger)."""
@@ -343,60 +813,29 @@ class StoneTimerServer:
     def get_sensors_status(self) -> dict:
         """Return sensor liveness status for the UI."""
         now = time.time()
-        # Always show these three sensors in the UI; hog_close is local on the Pi 4.
-        sensors = [
-            {'device_id': 'tee', 'label': 'Tee'},
-            {'device_id': 'hog_close', 'label': 'Hog near'},
-            {'device_id': 'hog_far', 'label': 'Hog far'},
-        ]
-
-        out = []
-        for s in sensors:
-            device_id = s['device_id']
-            meta = self.sensor_last_seen.get(device_id)
-
-            # Local hog_close doesn't send heartbeat; mark as "local" (neutral) unless we've seen a trigger.
-            if device_id == 'hog_close' and meta is None:
-                out.append({
-                    **s,
-                    'status': 'local',
-                    'last_seen_s_ago': None,
-                    'ip': None,
-                    'source': None
-                })
-                continue
-
+        for entry in self._sensor_status:
+            meta = self.sensor_last_seen.get(entry['device_id'])
             if meta is None:
-                out.append({
-                    **s,
-                    'status': 'offline',
-                    'last_seen_s_ago': None,
-                    'ip': None,
-                    'source': None
-                })
-                continue
-
-            age = float(now - float(meta.get('last_seen_ts', now)))
-            status = 'online' if age <= self.sensor_timeout_s else 'offline'
-            out.append({
-                **s,
-                'status': status,
-                'last_seen_s_ago': round(age, 1),
-                'ip': meta.get('ip'),
-                'source': meta.get('source')
-            })
-
-        return {'timeout_s': self.sensor_timeout_s, 'sensors': out}
+                continue  # Never seen: keeps its initial local/offline entry
+            age = now - meta['last_seen_ts']
+            entry['status'] = 'online' if age <= self.sensor_timeout_s else 'offline'
+            entry['last_seen_s_ago'] = round(age, 1)
+            entry['ip'] = meta['ip']
+            entry['source'] = meta['source']
+        return {'timeout_s': self.sensor_timeout_s, 'sensors': self._sensor_status}
     
     def _handle_trigger(self, device_id: str, timestamp_ns: int):
         """Handle a trigger from a sensor."""
         logger.info(f"Trigger: {device_id}")
         
+        handler = self._TRIGGER_HANDLERS.get(device_id)
+        if handler is None:
+            logger.warning(f"Ignoring trigger from unknown device {device_id!r}")
+            return
+        
         # hog_far can arrive after COMPLETED - update the latest measurement
         if device_id == 'hog_far' and self.state == SystemState.COMPLETED:
-            if not self.session.hog_far_time_ns:
-                self.session.hog_far_time_ns = timestamp_ns
-                self._update_last_record()
+            if handler(self, timestamp_ns):
                 self.broadcast_state()
             return
         
@@ -406,51 +845,84 @@ class StoneTimerServer:
             return
         
         # First trigger starts the measurement
-        if self.state == SystemState.ARMED:
+        started = self.state == SystemState.ARMED
+        if started:
             self.state = SystemState.MEASURING
-            self.session.started_at = datetime.now()
+            self._state_dirty = True
+            self.session.start(datetime.now())
             self._measurement_token += 1
             self._schedule_auto_rearm(self._measurement_token)
         
-        # Record timestamp (first only for each sensor, in correct order)
-        if device_id == 'tee' and not self.session.tee_time_ns:
-            self.session.tee_time_ns = timestamp_ns
-            
-        elif device_id == 'hog_close' and not self.session.hog_close_time_ns:
-            # Ignore if hog_close arrives before tee (invalid order)
-            if self.session.tee_time_ns and timestamp_ns > self.session.tee_time_ns:
-                self.session.hog_close_time_ns = timestamp_ns
-                # Measurement is \"complete\" after hog_close - save immediately
-                self._complete_measurement()
-            else:
-                logger.debug("Ignoring hog_close - arrived before tee")
-            
-        elif device_id == 'hog_far' and not self.session.hog_far_time_ns:
-            # Ignore if hog_far arrives before hog_close (invalid order)
-            if self.session.hog_close_time_ns and timestamp_ns > self.session.hog_close_time_ns:
-                self.session.hog_far_time_ns = timestamp_ns
-                self._update_last_record()
-            else:
-                logger.debug("Ignoring hog_far - arrived before hog_close")
-        
-        self.broadcast_state()
+        if handler(self, timestamp_ns) or started:
+            self.broadcast_state()
+    
+    # Per-sensor handlers: record the timestamp (first only for each sensor, in
+    # correct order) and return True if the session changed.
+    
+    def _on_tee(self, timestamp_ns: int) -> bool:
+        if self.session.tee_time_ns:
+            return False
+        self.session.set_time('tee', timestamp_ns)
+        self._state_dirty = True
+        return True
+    
+    def _on_hog_close(self, timestamp_ns: int) -> bool:
+        if self.session.hog_close_time_ns:
+            return False
+        # Ignore if hog_close arrives before tee (invalid order)
+        tee = self.session.tee_time_ns
+        if tee is None:
+            logger.debug("Ignoring hog_close - arrived before tee")
+            return False
+        if timestamp_ns <= tee:
+            # Arrived later but stamped earlier: the clocks disagree (step or lost sync)
+            logger.warning(f"Ignoring hog_close - stamped {(tee - timestamp_ns) / 1_000_000:.1f}ms "
+                           f"before tee, check clock sync")
+            return False
+        self.session.set_time('hog_close', timestamp_ns)
+        # Measurement is "complete" after hog_close - save immediately
+        self._complete_measurement()
+        return True
+    
+    def _on_hog_far(self, timestamp_ns: int) -> bool:
+        if self.session.hog_far_time_ns:
+            return False
+        # Ignore if hog_far arrives before hog_close (invalid order)
+        hog_close = self.session.hog_close_time_ns
+        if hog_close is None:
+            logger.debug("Ignoring hog_far - arrived before hog_close")
+            return False
+        if timestamp_ns <= hog_close:
+            logger.warning(f"Ignoring hog_far - stamped {(hog_close - timestamp_ns) / 1_000_000:.1f}ms "
+                           f"before hog_close, check clock sync")
+            return False
+        self.session.set_time('hog_far', timestamp_ns)
+        self._state_dirty = True
+        self._update_last_record()
+        return True
+    
+    _TRIGGER_HANDLERS = {
+        'tee': _on_tee,
+        'hog_close': _on_hog_close,
+        'hog_far': _on_hog_far,
+    }
     
     def _complete_measurement(self):
         """Complete measurement after hog_close."""
         self.state = SystemState.COMPLETED
+        self._state_dirty = True
         
-        record = TimingRecord(
-            id=self._next_id,
-            timestamp=self.session.started_at,
-            tee_to_hog_close_ms=self.session.tee_to_hog_close_ms,
-            hog_to_hog_ms=None,  # Filled if the stone reaches hog_far
-            total_ms=None
-        )
+        record = {
+            'id': self._next_id,
+            'timestamp': self.session.started_at_iso,
+            'tee_to_hog_close_ms': self.session.tee_to_hog_close_ms,
+            'hog_to_hog_ms': None,  # Filled if the stone reaches hog_far
+            'total_ms': None
+        }
         self._next_id += 1
-        self.history.insert(0, record)
-        
-        if len(self.history) > 100:
-            self.history = self.history[:100]
+        self.history.appendleft(record)
+        self._history_json.clear()
+        self._persist_history(record)
         
         logger.info(f"Complete: TEE→HOG={self.session.tee_to_hog_close_ms:.1f}ms")
         
@@ -460,8 +932,10 @@ class StoneTimerServer:
     def _update_last_record(self):
         """Update the latest measurement with hog_far time."""
         if self.history:
-            self.history[0].hog_to_hog_ms = self.session.hog_to_hog_ms
-            self.history[0].total_ms = self.session.total_ms
+            self.history[0]['hog_to_hog_ms'] = self.session.hog_to_hog_ms
+            self.history[0]['total_ms'] = self.session.total_ms
+            self._history_json.clear()
+            self._persist_history(self.history[0])
             hog_hog = self.session.hog_to_hog_ms
             total = self.session.total_ms
             if hog_hog and total:
@@ -475,21 +949,102 @@ class StoneTimerServer:
             return
         if not text:
             return
-
+        self._queue_tts(text)
+    
+    def _queue_tts(self, text: str):
+        """Hand an utterance to the TTS worker (thread-safe, never blocks)."""
+        if self._tts_queue is None or not self._loop.is_running():
+            logger.debug(f"TTS worker not running, dropping {text!r}")
+            return
+        if self._in_loop_thread():
+            self._put_tts(text)
+        else:
+            # gpiozero callbacks run in their own threads
+            self._loop.call_soon_threadsafe(self._put_tts, text)
+    
+    def _put_tts(self, text: str):
+        # The worker may have been stopped since _queue_tts checked
+        queue = self._tts_queue
+        if queue is None:
+            return
+        # Drop the oldest pending utterance rather than falling behind
+        if queue.full():
+            logger.warning(f"TTS queue full, dropping {queue.get_nowait()!r}")
+        queue.put_nowait(text)
+    
+    def start_tts_worker(self):
+        self._tts_queue = asyncio.Queue(maxsize=TTS_QUEUE_MAX)
+        self._tts_task = self._loop.create_task(self._tts_worker())
+        # Reap speak.sh as soon as it exits, not only when the next one is spawned
         try:
+            self._loop.add_signal_handler(signal.SIGCHLD, self._reap_tts)
+        except (NotImplementedError, RuntimeError) as e:
+            logger.warning(f"Could not watch SIGCHLD: {e}")
+    
+    async def stop_tts_worker(self):
+        self._tts_queue = None
+        self._loop.remove_signal_handler(signal.SIGCHLD)
+        if self._tts_task is not None:
+            self._tts_task.cancel()
+            try:
+                await self._tts_task
+            except asyncio.CancelledError:
+                pass
+            self._tts_task = None
+        self.close_tts()
+    
+    async def _tts_worker(self):
+        """Speak queued utterances one at a time, off the event loop."""
+        queue = self._tts_queue
+        while True:
+            text = await queue.get()
+            await self._loop.run_in_executor(None, self._say, text)
+    
+    def _say(self, text: str):
+        """Speak text via Piper (speak.sh), falling back to espeak-ng (blocking)."""
+        try:
+            # Try Piper script first, then fallback to espeak-ng
             speak_script = '/opt/piper/speak.sh'
             if os.path.exists(speak_script):
+                self._cache_phrase_audio(text)
+                logger.info(f"Spawning: {speak_script} '{text}'")
                 self._spawn_tts(text)
             else:
-                subprocess.Popen(
-                    ['/usr/bin/espeak-ng', '-v', 'en', '-s', '150', text],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    env=self._tts_env()
-                )
+                logger.warning("speak.sh not found, using espeak-ng")
+                self._espeak(text)
+        except FileNotFoundError:
+            logger.warning("TTS not installed")
         except Exception as e:
             logger.error(f"TTS error: {e}\n{traceback.format_exc()}")
     
+    def _cache_phrase_audio(self, text: str):
+        """Stitch a phrase's fragments into phrases/<key>.raw once (like speak.sh does per call).
+        
+        Times repeat in 10ms steps, so after the first callout of a value speak.sh
+        just plays the cached file instead of concatenating fragments again.
+        """
+        # Same key normalization as speak.sh
+        key = re.sub(r'[^a-z0-9]+', '_', text.lower()).strip('_')
+        if key in self._cached_phrases:
+            return
+        phrase_file = PIPER_CACHE_DIR / 'phrases' / f"{key}.raw"
+        if phrase_file.exists():
+            self._cached_phrases.add(key)
+            return
+        try:
+            silence = (PIPER_CACHE_DIR / 'silence_60ms.raw').read_bytes()
+            parts = []
+            for token in text.split():
+                parts.append((PIPER_CACHE_DIR / 'fragments' / f"{token}.raw").read_bytes())
+                parts.append(silence)
+            tmp = phrase_file.with_suffix('.tmp')
+            tmp.write_bytes(b''.join(parts))
+            tmp.replace(phrase_file)
+            self._cached_phrases.add(key)
+        except OSError:
+            # Missing fragment or no cache dir: speak.sh falls back to Piper synthesis
+            pass
+    
     def _speak_time(self, time_ms: float, time_type: str = 'tee_hog'):
         """Speak a time value via text-to-speech."""
         if not self.speech_settings.get('speech_enabled', False):
@@ -505,46 +1060,16 @@ class StoneTimerServer:
         if time_ms is None or time_ms <= 0:
             return
             
-        try:
-            # Convert to seconds
-            seconds = time_ms / 1000.0
-            
-            # Format exactly like the UI and speak it.
-            # We speak hundredths in a more natural way:
-            # - "3.10" -> "3 point 10"
-            # - "3.06" -> "3 point oh 6"
-            # - "3.00" -> "3 point 00"
-            formatted = f"{seconds:.2f}"  # "3.18"
-            whole, dec = formatted.split('.')  # dec is always 2 digits
-            if dec == "00":
-                dec_spoken = "00"
-            elif dec.startswith("0"):
-                dec_spoken = f"oh {dec[1]}"
-            else:
-                dec_spoken = dec
-            text = f"{whole} point {dec_spoken}"
-            
-            logger.info(f"Speaking: '{text}'")
-            
-            # Try Piper script first, then fallback to espeak-ng
-            speak_script = '/opt/piper/speak.sh'
-            
-            if os.path.exists(speak_script):
-                # Non-blocking so UI updates aren't delayed while TTS plays
-                logger.info(f"Spawning: {speak_script} '{text}'")
-                self._spawn_tts(text)
-            else:
-                logger.warning("speak.sh not found, using espeak-ng")
-                subprocess.Popen(
-                    ['/usr/bin/espeak-ng', '-v', 'en', '-s', '150', text],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    env=self._tts_env()
-                )
-        except FileNotFoundError:
-            logger.warning("TTS not installed")
-        except Exception as e:
-            logger.error(f"TTS error: {e}")
+        # Convert to seconds
+        seconds = time_ms / 1000.0
+        
+        # Format exactly like the UI and speak it (see SPOKEN_HUNDREDTHS)
+        whole, dec = f"{seconds:.2f}".split('.')  # dec is always 2 digits
+        text = f"{whole} point {SPOKEN_HUNDREDTHS[dec]}"
+        
+        logger.info(f"Speaking: '{text}'")
+        # Queued: the measurement path never waits on process spawns or audio
+        self._queue_tts(text)
     
     def arm(self):
         """Arm the system.
@@ -557,6 +1082,7 @@ class StoneTimerServer:
         
         self.session.reset()
         self.state = SystemState.ARMED
+        self._state_dirty = True
         logger.info("ARMED")
         self._cancel_auto_rearm()
         # Broadcast first so UI updates instantly, then speak (which is non-blocking anyway)
@@ -569,6 +1095,7 @@ class StoneTimerServer:
         """Disarm."""
         self.state = SystemState.IDLE
         self.session.reset()
+        self._state_dirty = True
         logger.info("DISARMED")
         self._cancel_auto_rearm()
         self.broadcast_state()
@@ -655,27 +1182,107 @@ class StoneTimerServer:
             logger.warning(f"Failed to save runtime settings: {e}")
     
     def get_history(self, limit: int = 50) -> list[dict]:
-        return [
-            {
-                'id': r.id,
-                'timestamp': r.timestamp.isoformat(),
-                'tee_to_hog_close_ms': r.tee_to_hog_close_ms,
-                'hog_to_hog_ms': r.hog_to_hog_ms,
-                'total_ms': r.total_ms
-            }
-            for r in self.history[:limit]
-        ]
+        return list(islice(self.history, max(limit, 0)))
+    
+    def history_json(self, limit: int = 50) -> bytes:
+        """get_history() encoded as JSON, cached until the history changes."""
+        # Clamp so every limit past the deque size shares one cache entry
+        limit = min(max(limit, 0), self.history.maxlen)
+        body = self._history_json.get(limit)
+        if body is None:
+            body = self._history_json[limit] = json_dumps_bytes(self.get_history(limit))
+        return body
     
     def delete_record(self, record_id: int) -> bool:
         for i, r in enumerate(self.history):
-            if r.id == record_id:
-                self.history.pop(i)
+            if r['id'] == record_id:
+                del self.history[i]
+                self._history_json.clear()
+                self._persist_history({'id': record_id, 'deleted': True})
                 return True
         return False
     
     def clear_history(self):
         self.history.clear()
+        self._history_json.clear()
         self._next_id = 1
+        self._history_lines = 0
+        self._submit_history(self._rewrite_history_file, [])
+    
+    def _load_history(self) -> None:
+        """Restore the history from HISTORY_PATH (best-effort)."""
+        try:
+            if not HISTORY_PATH.exists():
+                return
+            records: dict[int, dict] = {}
+            with open(HISTORY_PATH, 'rb') as f:
+                for line in f:
+                    self._history_lines += 1
+                    try:
+                        record = json_loads(line)
+                    except ValueError:
+                        continue  # e.g. a line cut short by power loss
+                    if not isinstance(record, dict) or 'id' not in record:
+                        continue
+                    if record.get('deleted'):
+                        records.pop(record['id'], None)
+                    else:
+                        records[record['id']] = record
+            # Oldest first, so appendleft leaves the newest at history[0]
+            for record_id in sorted(records):
+                self.history.appendleft(records[record_id])
+            if records:
+                self._next_id = max(records) + 1
+            logger.info(f"Loaded {len(self.history)} measurements from {HISTORY_PATH}")
+        except Exception as e:
+            logger.warning(f"Failed to load history: {e}")
+    
+    def _persist_history(self, record: dict) -> None:
+        """Queue one record for appending to HISTORY_PATH."""
+        # Encode now: the newest record is updated in place when hog_far arrives
+        line = json_dumps_bytes(record) + b'\n'
+        self._history_lines += 1
+        if self._history_lines > 2 * self.history.maxlen:
+            # Mostly superseded lines by now; rewrite with just the live records
+            self._history_lines = len(self.history)
+            lines = [json_dumps_bytes(r) + b'\n' for r in reversed(self.history)]
+            self._submit_history(self._rewrite_history_file, lines)
+        else:
+            self._submit_history(self._append_history_line, line)
+    
+    def _submit_history(self, fn, *args) -> None:
+        # A trigger can still arrive while shutting down; it just isn't persisted
+        if self._history_closed:
+            logger.warning("History writer closed, not persisting change")
+            return
+        self._history_writer.submit(fn, *args)
+    
+    def _append_history_line(self, line: bytes) -> None:
+        try:
+            if self._history_fp is None:
+                self._history_fp = open(HISTORY_PATH, 'ab', buffering=0)
+            self._history_fp.write(line)
+        except Exception as e:
+            logger.warning(f"Failed to write history: {e}")
+    
+    def _rewrite_history_file(self, lines: list[bytes]) -> None:
+        try:
+            if self._history_fp is not None:
+                self._history_fp.close()
+                self._history_fp = None
+            tmp = HISTORY_PATH.with_suffix('.tmp')
+            tmp.write_bytes(b''.join(lines))
+            tmp.replace(HISTORY_PATH)
+        except Exception as e:
+            logger.warning(f"Failed to rewrite history: {e}")
+    
+    def close_history(self) -> None:
+        """Finish pending history writes."""
+        self._history_closed = True
+        self._history_writer.shutdown(wait=True)
+        if self._history_fp is not None:
+            self._history_fp.close()
+            self._history_fp = None
     
     def get_state(self) -> dict:
         return {
@@ -684,28 +1291,85 @@ class StoneTimerServer:
             'sensors': {}
         }
     
+    def _in_loop_thread(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+    
     def broadcast_state(self):
         """Broadcast state to all clients (thread-safe)."""
-        if self._loop and self._loop.is_running():
-            asyncio.run_coroutine_threadsafe(self._broadcast_state(), self._loop)
+        if not self.websocket_clients:
+            # Headless run: nothing to encode; a client that connects later is sent the state then.
+            # Forget the last broadcast so the next change is never deduplicated against it.
+            self._last_broadcast = None
+            return
+        if not (self._loop and self._loop.is_running()):
+            return
+        if self._in_loop_thread():
+            # UDP triggers and API calls: already on the loop, no thread hop needed
+            self._schedule_broadcast()
+        else:
+            # gpiozero callbacks run in their own threads
+            self._loop.call_soon_threadsafe(self._schedule_broadcast)
     
-    async def _broadcast_state(self):
-        state = self.get_state()
-        message = json.dumps({'type': 'state_update', 'data': state})
-
-        # Iterate over a snapshot so connect/disconnect can't break iteration.
-        dead: list[WebSocket] = []
-        for ws in list(self.websocket_clients):
+    def _schedule_broadcast(self):
+        """Arm the coalescing timer unless a broadcast is already pending."""
+        if self._broadcast_handle is None:
+            self._broadcast_handle = self._loop.call_later(BROADCAST_COALESCE_S, self._broadcast_state)
+    
+    def state_message(self) -> str:
+        """The serialized state_update message, cached until the state changes."""
+        if self._state_dirty or self._state_json is None:
+            # Clear the flag first: a change made while we serialize marks it dirty again
+            self._state_dirty = False
+            self._state_json = json_dumps({'type': 'state_update', 'data': self.get_state()})
+        return self._state_json
+    
+    def status_json(self) -> bytes:
+        """get_state() encoded for /api/status, rebuilt only when state_message() changes."""
+        message = self.state_message()
+        if message is not self._status_for:
+            self._status_json = json_dumps_bytes(self.get_state())
+            self._status_for = message
+        return self._status_json
+    
+    def _broadcast_state(self):
+        self._broadcast_handle = None
+        message = self.state_message()
+        if message == self._last_broadcast:
+            # Nothing visible changed; clients already have this (new ones get it on connect)
+            return
+        self._last_broadcast = message
+        # Only enqueue: each client's sender task does the (possibly slow) write
+        for queue in list(self.websocket_clients.values()):
+            self.enqueue_message(queue, message)
+    
+    @staticmethod
+    def enqueue_message(queue: asyncio.Queue, message: str):
+        """Queue a message for one client, dropping the oldest one if full."""
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(message)
+    
+    async def websocket_sender(self, websocket: WebSocket, queue: asyncio.Queue):
+        """Send queued messages to one client until it fails or stalls."""
+        try:
+            while True:
+                message = await queue.get()
+                await asyncio.wait_for(websocket.send_text(message), timeout=WS_SEND_TIMEOUT_S)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Dead or stalled client: stop broadcasting to it
+            if isinstance(e, asyncio.TimeoutError):
+                logger.warning(f"WebSocket client stalled for {WS_SEND_TIMEOUT_S}s, dropping it")
+            self.websocket_clients.pop(websocket, None)
+            # Close the socket too, so the client notices and reconnects
+            # instead of keeping an open connection that gets no updates
             try:
-                await ws.send_text(message)
+                await asyncio.wait_for(websocket.close(code=1011), timeout=WS_SEND_TIMEOUT_S)
             except Exception:
-                dead.append(ws)
-
-        # Drop dead sockets so the list does not grow forever.
-        for ws in dead:
-            try:
-                self.websocket_clients.remove(ws)
-            except ValueError:
                 pass
 
 
@@ -716,19 +1380,32 @@ server = StoneTimerServer()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     server._loop = asyncio.get_running_loop()
+    # TTS runs in the default executor; its threads (and the speak.sh/piper/aplay
+    # processes they spawn) must not share the loop's pinned core
+    server._loop.set_default_executor(ThreadPoolExecutor(thread_name_prefix='worker',
+                                                         initializer=_unpin_thread))
     server.setup_gpio()
+    server.start_tts_worker()
     server.start_udp_listener()
     # Optional: arm immediately on boot so you don't need to press Rearm the first time.
-    if server.config.get('server', {}).get('auto_arm_on_start', False):
+    if server.auto_arm_on_start:
         server.arm()
     yield
     server.stop_udp_listener()
+    server.close_gpio()
+    await server.stop_tts_worker()
+    server.close_history()
     # gpiozero hanterar cleanup automatiskt
 
 
 app = FastAPI(title="StoneTimer", version="1.0.0", lifespan=lifespan)
 
 
+def json_response(obj) -> Response:
+    """Encode directly, skipping FastAPI's jsonable_encoder pass (plain JSON types only)."""
+    return Response(content=json_dumps_bytes(obj), media_type="application/json")
+
+
 @app.post("/api/arm")
 async def arm_system():
     success = server.arm()
@@ -743,22 +1420,22 @@ async def disarm_system():
 
 @app.get("/api/status")
 async def get_status():
-    return server.get_state()
+    return Response(content=server.status_json(), media_type="application/json")
 
 
 @app.get("/api/sensors")
 async def get_sensors():
-    return server.get_sensors_status()
+    return json_response(server.get_sensors_status())
 
 
 @app.get("/api/current")
 async def get_current():
-    return server.session.to_dict()
+    return json_response(server.session.to_dict())
 
 
 @app.get("/api/times")
 async def get_times(limit: int = 50):
-    return server.get_history(limit)
+    return Response(content=server.history_json(limit), media_type="application/json")
 
 
 @app.post("/api/clear")
@@ -808,14 +1485,15 @@ async def clear_times():
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    server.websocket_clients.append(websocket)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=WS_QUEUE_MAX)
+    server.enqueue_message(queue, server.state_message())
+    server.websocket_clients[websocket] = queue
+    sender = asyncio.create_task(server.websocket_sender(websocket, queue))
     
     try:
-        await websocket.send_text(json.dumps({'type': 'state_update', 'data': server.get_state()}))
-        
         while True:
             data = await websocket.receive_text()
-            message = json.loads(data)
+            message = json_loads(data)
             
             if message.get('type') == 'arm':
                 server.arm()
@@ -824,13 +1502,16 @@ async def websocket_endpoint(websocket: WebSocket):
 
     except WebSocketDisconnect:
         pass
+    except RuntimeError:
+        # The sender closed a stalled client (and logged it); receiving on the
+        # closed socket fails. Anything else is unexpected.
+        if not sender.done():
+            logger.exception("WebSocket error")
     except Exception:
         logger.exception("WebSocket error")
     finally:
-        try:
-            server.websocket_clients.remove(websocket)
-        except ValueError:
-            pass
+        server.websocket_clients.pop(websocket, None)
+        sender.cancel()
 
 
 static_path = Path(__file__).parent / "static"
@@ -838,15 +1519,17 @@ if static_path.exists():
     app.mount("/static", StaticFiles(directory=static_path), name="static")
 
 
-@app.get("/favicon.ico")
-async def favicon():
-    # Serve a tiny SVG favicon (text-based) so kiosk loading probes can reliably detect "server up".
-    svg = """<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 64 64">
+# Tiny SVG favicon (text-based) so kiosk loading probes can reliably detect "server up"
+FAVICON_SVG = b"""<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 64 64">
   <rect width="64" height="64" rx="12" fill="#000"/>
   <circle cx="32" cy="32" r="18" fill="#fff"/>
   <circle cx="32" cy="32" r="10" fill="#111"/>
 </svg>"""
-    return Response(content=svg, media_type="image/svg+xml")
+
+
+@app.get("/favicon.ico")
+async def favicon():
+    return Response(content=FAVICON_SVG, media_type="image/svg+xml")
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -857,11 +1540,41 @@ async def root():
     return HTMLResponse("<h1>StoneTimer</h1>")
 
 
+def set_realtime():
+    """Best-effort: real-time priority and a dedicated core for the event loop.
+    
+    Only the main thread (event loop: UDP receive, trigger handling) runs
+    SCHED_FIFO; SCHED_RESET_ON_FORK keeps worker threads and child processes on
+    normal scheduling. The CPU mask is inherited, though: the history writer and
+    the default executor (TTS, and the processes it spawns) reset it to all CPUs
+    via _unpin_thread. Threads we don't create - anyio's threadpool (static file
+    reads) and gpiozero's callback threads - stay on the loop's core.
+    Needs root/CAP_SYS_NICE.
+    """
+    global _all_cpus
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO | os.SCHED_RESET_ON_FORK, os.sched_param(20))
+    except (AttributeError, OSError) as e:
+        logger.warning(f"Could not set SCHED_FIFO: {e}")
+    try:
+        cpus = os.sched_getaffinity(0)
+        if len(cpus) > 1:
+            os.sched_setaffinity(0, {max(cpus)})
+            _all_cpus = cpus
+    except (AttributeError, OSError) as e:
+        logger.warning(f"Could not set CPU affinity: {e}")
+
+
 def main():
+    set_realtime()
     uvicorn.run(
         app,
-        host=server.config['server']['host'],
-        port=server.config['server']['http_port'],
+        host=server.host,
+        port=server.http_port,
+        # Picks uvloop and httptools when installed (requirements-server.txt),
+        # falling back to the stdlib loop and h11 otherwise
+        loop="auto",
+        http="auto",
         log_level="info"
     )
 
@@ -0,0 +1,118 @@
+"""
+StoneTimer timing core: the per-run measurement session.
+
+Pure Python, but kept free of FastAPI/asyncio so it can optionally be
+compiled with mypyc (see install_server.sh, STONETIMER_MYPYC=1). The compiled
+extension is picked up by `import timing_core` in place of this file.
+"""
+
+from array import array
+from datetime import datetime
+from typing import Optional
+
+
+# TimingSession timestamp slots, in course order
+TEE, HOG_CLOSE, HOG_FAR = 0, 1, 2
+SESSION_SLOTS = {'tee': TEE, 'hog_close': HOG_CLOSE, 'hog_far': HOG_FAR}
+SLOT_KEYS = ('tee_time_ns', 'hog_close_time_ns', 'hog_far_time_ns')
+TEE_AND_HOG_CLOSE = (1 << TEE) | (1 << HOG_CLOSE)
+HOG_CLOSE_AND_FAR = (1 << HOG_CLOSE) | (1 << HOG_FAR)
+TEE_AND_HOG_FAR = (1 << TEE) | (1 << HOG_FAR)
+
+
+class TimingSession:
+    """Holds state for a measurement session.
+    
+    The three timestamps live in one array('q') with a bitmask of which slots
+    are set. Splits are computed when a timestamp is recorded (set_time), and
+    the dict served to clients is kept up to date alongside, so reads are just
+    copies.
+    """
+    
+    # No per-instance __dict__ when running uncompiled (mypyc classes have none anyway)
+    __slots__ = ('times_ns', 'mask', 'tee_to_hog_close_ms', 'hog_to_hog_ms', 'total_ms',
+                 'started_at', 'started_at_iso', '_dict')
+    
+    times_ns: array
+    mask: int
+    tee_to_hog_close_ms: Optional[float]
+    hog_to_hog_ms: Optional[float]
+    total_ms: Optional[float]
+    started_at: Optional[datetime]
+    started_at_iso: Optional[str]
+    _dict: dict
+    
+    def __init__(self) -> None:
+        self.times_ns = array('q', [0, 0, 0])
+        self.reset()
+    
+    def reset(self) -> None:
+        self.mask = 0
+        self.tee_to_hog_close_ms = None
+        self.hog_to_hog_ms = None
+        self.total_ms = None
+        self.started_at = None
+        self.started_at_iso = None
+        self._dict = {
+            'tee_time_ns': None,
+            'hog_close_time_ns': None,
+            'hog_far_time_ns': None,
+            'tee_to_hog_close_ms': None,
+            'hog_to_hog_ms': None,
+            'total_ms': None,
+            'has_hog_close': False,
+            'has_hog_far': False,
+            'started_at': None
+        }
+    
+    def get_time(self, slot: int) -> Optional[int]:
+        return self.times_ns[slot] if self.mask & (1 << slot) else None
+    
+    @property
+    def tee_time_ns(self) -> Optional[int]:
+        return self.get_time(TEE)
+    
+    @property
+    def hog_close_time_ns(self) -> Optional[int]:
+        return self.get_time(HOG_CLOSE)
+    
+    @property
+    def hog_far_time_ns(self) -> Optional[int]:
+        return self.get_time(HOG_FAR)
+    
+    @property
+    def has_hog_close(self) -> bool:
+        """True if the stone passed the near hog line."""
+        return self.mask & TEE_AND_HOG_CLOSE == TEE_AND_HOG_CLOSE
+    
+    @property
+    def has_hog_far(self) -> bool:
+        """True om stenen passerat andra hog-linjen."""
+        return bool(self.mask & (1 << HOG_FAR))
+    
+    def start(self, started_at: datetime) -> None:
+        # Display only; splits never touch datetime. Formatted once per end.
+        self.started_at = started_at
+        self.started_at_iso = self._dict['started_at'] = started_at.isoformat()
+    
+    def set_time(self, device_id: str, timestamp_ns: int) -> None:
+        """Record a sensor timestamp and the splits it completes."""
+        slot = SESSION_SLOTS.get(device_id)
+        if slot is None:
+            return
+        t = self.times_ns
+        t[slot] = timestamp_ns
+        mask = self.mask = self.mask | (1 << slot)
+        d = self._dict
+        d[SLOT_KEYS[slot]] = timestamp_ns
+        if mask & TEE_AND_HOG_CLOSE == TEE_AND_HOG_CLOSE:
+            self.tee_to_hog_close_ms = d['tee_to_hog_close_ms'] = (t[HOG_CLOSE] - t[TEE]) / 1_000_000
+            d['has_hog_close'] = True
+        if mask & HOG_CLOSE_AND_FAR == HOG_CLOSE_AND_FAR:
+            self.hog_to_hog_ms = d['hog_to_hog_ms'] = (t[HOG_FAR] - t[HOG_CLOSE]) / 1_000_000
+        if mask & TEE_AND_HOG_FAR == TEE_AND_HOG_FAR:
+            self.total_ms = d['total_ms'] = (t[HOG_FAR] - t[TEE]) / 1_000_000
+        d['has_hog_far'] = bool(mask & (1 << HOG_FAR))
+    
+    def to_dict(self) -> dict:
+        return self._dict.copy()
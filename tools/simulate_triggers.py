@@ -4,14 +4,15 @@ Simulate sensor triggers for testing.
 Sends UDP messages directly to the server.
 """
 
+import ctypes
 import socket
+import struct
 import time
 import json
 import argparse
+import os
 import random
-import urllib.request
-import urllib.error
-from datetime import datetime
+import http.client
 from pathlib import Path
 from typing import Optional, Tuple
 
@@ -23,6 +24,8 @@ except Exception:  # pragma: no cover
 DEFAULT_SERVER = "192.168.50.1"
 DEFAULT_PORT = 5000
 DEFAULT_HTTP_PORT = 8080
+# Room for --no-delay bursts without send blocking (kernel caps it at wmem_max)
+UDP_SNDBUF = 1 << 20
 
 # Realistic timing ranges (seconds)
 TEE_HOG_MIN = 2.80
@@ -30,6 +33,38 @@ TEE_HOG_MAX = 3.30
 HOG_HOG_MIN = 8.0
 HOG_HOG_MAX = 14.0
 
+# Sensor wire format (see ARCHITECTURE.md): type tag, device index, timestamp_ns,
+# ts_mono_ns. ts_mono_ns is sent as 0 ("not provided"): all simulated devices
+# share this host's clock, so the server's per-sensor clock-step check is skipped.
+SENSOR_FRAME = struct.Struct('<BBQQ')
+MSG_TRIGGER = 1
+DEVICE_INDEX = {"tee": 0, "hog_close": 1, "hog_far": 2}
+
+
+# struct iovec / msghdr / mmsghdr for sendmmsg(2) (Linux)
+class _IoVec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p), ('iov_len', ctypes.c_size_t)]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p), ('msg_namelen', ctypes.c_uint),
+                ('msg_iov', ctypes.POINTER(_IoVec)), ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p), ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _MsgHdr), ('msg_len', ctypes.c_uint)]
+
+
+# Resolved once; None where libc has no sendmmsg (non-Linux)
+try:
+    _sendmmsg = ctypes.CDLL(None, use_errno=True).sendmmsg
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_MMsgHdr), ctypes.c_uint, ctypes.c_int]
+    _sendmmsg.restype = ctypes.c_int
+except (AttributeError, OSError):
+    _sendmmsg = None
+
 
 def _load_server_from_config(config_path: Path) -> Optional[Tuple[str, int, int]]:
     """Load (host, udp_port, http_port) from a StoneTimer config.yaml if available."""
@@ -39,7 +74,8 @@ def _load_server_from_config(config_path: Path) -> Optional[Tuple[str, int, int]
         return None
     try:
         with open(config_path, "r", encoding="utf-8") as f:
-            cfg = yaml.safe_load(f) or {}
+            # libyaml-backed loader when PyYAML was built with it
+            cfg = yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader)) or {}
         server = (cfg or {}).get("server", {}) or {}
         host = server.get("host") or DEFAULT_SERVER
         udp_port = int(server.get("udp_port") or server.get("port") or DEFAULT_PORT)
@@ -52,40 +88,107 @@ def _load_server_from_config(config_path: Path) -> Optional[Tuple[str, int, int]
         return None
 
 
-def arm_server(server_host: str, http_port: int, timeout_s: float = 1.0) -> bool:
-    """Best-effort: ask the StoneTimer server to arm (rearm) via HTTP."""
-    url = f"http://{server_host}:{http_port}/api/arm"
-    req = urllib.request.Request(url, method="POST")
-    try:
-        with urllib.request.urlopen(req, timeout=timeout_s) as resp:
-            body = resp.read().decode("utf-8", errors="replace")
+def arm_server(conn: http.client.HTTPConnection) -> bool:
+    """Best-effort: ask the StoneTimer server to arm (rearm) via HTTP.
+    
+    conn is reused across stones (keep-alive); it reconnects by itself after close().
+    """
+    for attempt in range(2):
         try:
-            data = json.loads(body) if body else {}
-        except json.JSONDecodeError:
-            data = {}
-        success = bool(data.get("success", True))
-        state = data.get("state", "unknown")
-        print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Rearm: success={success} state={state}")
-        return success
-    except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Rearm: failed ({e})")
-        return False
-
-
-def send_trigger(sock, server_addr, device_id: str):
-    """Send a trigger event."""
-    payload = {
-        'type': 'trigger',
-        'device_id': device_id,
-        'timestamp_ns': time.time_ns()
-    }
-    
-    data = json.dumps(payload).encode('utf-8')
-    sock.sendto(data, server_addr)
-    print(f"[{datetime.now().strftime('%H:%M:%S.%f')[:-3]}] Trigger: {device_id}")
-
-
-def simulate_stone_pass(sock, server_addr, delay_tee_hog: float = None, delay_hog_hog: float = None, skip_far: bool = False):
+            conn.request("POST", "/api/arm")
+            body = conn.getresponse().read().decode("utf-8", errors="replace")
+            break
+        except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+            # The server dropped the idle keep-alive connection; retry once on a new one
+            conn.close()
+            if attempt:
+                print(f"[{_clock_str(time.time_ns())}] Rearm: failed ({e})")
+                return False
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            print(f"[{_clock_str(time.time_ns())}] Rearm: failed ({e})")
+            return False
+    try:
+        data = json.loads(body) if body else {}
+    except json.JSONDecodeError:
+        data = {}
+    success = bool(data.get("success", True))
+    state = data.get("state", "unknown")
+    print(f"[{_clock_str(time.time_ns())}] Rearm: success={success} state={state}")
+    return success
+
+
+def _trigger_payload(device_id: str, timestamp_ns: int) -> bytes:
+    return SENSOR_FRAME.pack(MSG_TRIGGER, DEVICE_INDEX[device_id], timestamp_ns, 0)
+
+
+def _clock_str(ns: int) -> str:
+    """HH:MM:SS.mmm local time of a time.time_ns() value."""
+    return f"{time.strftime('%H:%M:%S', time.localtime(ns // 1_000_000_000))}.{ns // 1_000_000 % 1000:03d}"
+
+
+def send_trigger(sock, device_id: str):
+    """Send a trigger event (sock is connected to the server)."""
+    timestamp_ns = time.time_ns()
+    try:
+        sock.send(_trigger_payload(device_id, timestamp_ns))
+    except ConnectionRefusedError:
+        # ICMP port unreachable from an earlier send, reported on this one
+        print("   (server not listening on the UDP port)")
+    print(f"[{_clock_str(timestamp_ns)}] Trigger: {device_id}")
+
+
+def _sleep_until(deadline_ns: int) -> None:
+    """Sleep until an absolute time.monotonic_ns() deadline, finishing in 1 ms steps."""
+    while (remaining := deadline_ns - time.monotonic_ns()) > 0:
+        # One coarse sleep, then short ones so oversleep stays well under a millisecond
+        if remaining > 2_000_000:
+            time.sleep((remaining - 2_000_000) / 1e9)
+        else:
+            time.sleep(min(remaining, 1_000_000) / 1e9)
+
+
+def _sendmmsg_batch(sock, payloads: list) -> None:
+    """Send all payloads on a connected socket with a single sendmmsg(2) call, or one send each where unavailable."""
+    if _sendmmsg is None:
+        for data in payloads:
+            sock.send(data)
+        return
+    n = len(payloads)
+    bufs = [ctypes.create_string_buffer(data, len(data)) for data in payloads]
+    iovs = (_IoVec * n)()
+    msgs = (_MMsgHdr * n)()
+    for i, buf in enumerate(bufs):
+        iovs[i].iov_base = ctypes.addressof(buf)
+        iovs[i].iov_len = len(payloads[i])
+        hdr = msgs[i].msg_hdr
+        hdr.msg_iov = ctypes.pointer(iovs[i])
+        hdr.msg_iovlen = 1
+    sent = _sendmmsg(sock.fileno(), msgs, n, 0)
+    if sent < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    # A short count means the socket buffer filled up; send the rest one by one
+    for data in payloads[sent:]:
+        sock.send(data)
+
+
+def send_stone_burst(sock, delay_tee_hog: float, delay_hog_hog: float, skip_far: bool):
+    """Send a whole stone pass at once, stamped with the simulated times (stress testing)."""
+    t0 = time.time_ns()
+    triggers = [("tee", t0), ("hog_close", t0 + int(delay_tee_hog * 1e9))]
+    if not skip_far:
+        triggers.append(("hog_far", triggers[1][1] + int(delay_hog_hog * 1e9)))
+    try:
+        _sendmmsg_batch(sock, [_trigger_payload(d, ts) for d, ts in triggers])
+    except ConnectionRefusedError:
+        print("   (server not listening on the UDP port)")
+    for device_id, ts in triggers:
+        print(f"[{_clock_str(ts)}] Trigger: {device_id} (burst)")
+
+
+def simulate_stone_pass(sock, delay_tee_hog: float = None, delay_hog_hog: float = None, skip_far: bool = False,
+                        no_delay: bool = False):
     """Simulate a stone passing the sensors."""
     
     # Randomize times if not provided
@@ -102,21 +205,50 @@ def simulate_stone_pass(sock, server_addr, delay_tee_hog: float = None, delay_ho
         print(f"   (Stone does not reach far hog)")
     print()
     
+    if no_delay:
+        send_stone_burst(sock, delay_tee_hog, delay_hog_hog, skip_far)
+        print("\n✓ Done!")
+        return
+    
+    # Deadlines are absolute from the tee send, so time spent sending and
+    # printing doesn't stretch the simulated intervals
+    t0 = time.monotonic_ns()
+    hog_close_at = t0 + int(delay_tee_hog * 1e9)
+    
     # Tee
-    send_trigger(sock, server_addr, "tee")
+    send_trigger(sock, "tee")
     
     # Hog close
-    time.sleep(delay_tee_hog)
-    send_trigger(sock, server_addr, "hog_close")
+    _sleep_until(hog_close_at)
+    send_trigger(sock, "hog_close")
     
     # Hog far (if the stone reaches it)
     if not skip_far:
-        time.sleep(delay_hog_hog)
-        send_trigger(sock, server_addr, "hog_far")
+        _sleep_until(hog_close_at + int(delay_hog_hog * 1e9))
+        send_trigger(sock, "hog_far")
     
     print("\n✓ Done!")
 
 
+def pin_process(realtime: bool = False) -> None:
+    """Best-effort: keep the simulator on one core (and optionally SCHED_FIFO) for steadier pacing.
+    
+    Uses the second-highest CPU, since the server pins itself to the highest one
+    when both run on the Pi 4. The FIFO priority stays below the server's.
+    """
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) > 1:
+            os.sched_setaffinity(0, {cpus[-2] if len(cpus) > 2 else cpus[-1]})
+    except (AttributeError, OSError) as e:
+        print(f"Could not set CPU affinity: {e}")
+    if realtime:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO | os.SCHED_RESET_ON_FORK, os.sched_param(10))
+        except (AttributeError, OSError) as e:
+            print(f"Could not set SCHED_FIFO: {e}")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Simulate StoneTimer triggers via UDP")
     parser.add_argument("--server", default=None, help="Server IP/hostname (default: from config.yaml if found, else 192.168.50.1)")
@@ -136,8 +268,14 @@ def main():
                        help="Number of stone passes to simulate")
     parser.add_argument("--delay", type=float, default=3.0,
                        help="Seconds between stone passes when using --loop")
+    parser.add_argument("--no-delay", action="store_true",
+                       help="Send each stone's triggers at once (one sendmmsg), stamped with the simulated times")
+    
+    parser.add_argument("--rt", action="store_true",
+                       help="Run with SCHED_FIFO priority (needs root/CAP_SYS_NICE) for tighter trigger pacing")
     
     args = parser.parse_args()
+    pin_process(args.rt)
 
     # Resolve defaults from config when available (helps when running on the Pi 4 locally).
     config_candidates = []
@@ -156,13 +294,23 @@ def main():
     udp_port = int(args.port or (cfg_resolved[1] if cfg_resolved else DEFAULT_PORT))
     http_port = int(args.http_port or (cfg_resolved[2] if cfg_resolved else DEFAULT_HTTP_PORT))
 
-    server_addr = (server_host, udp_port)
-    print(f"Server: {server_addr[0]}:{server_addr[1]}")
+    # Resolve once; a hostname would otherwise be looked up for every trigger
+    try:
+        server_addr = socket.getaddrinfo(server_host, udp_port, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+    except socket.gaierror as e:
+        print(f"Cannot resolve {server_host}: {e}")
+        return
+    print(f"Server: {server_host}:{udp_port} ({server_addr[0]})")
     
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, UDP_SNDBUF)
+    # Connected UDP: the kernel checks the address and looks up the route once
+    sock.connect(server_addr)
+    
+    http_conn = http.client.HTTPConnection(server_host, http_port, timeout=1.0)
     
     if args.device:
-        send_trigger(sock, server_addr, args.device)
+        send_trigger(sock, args.device)
     elif args.simulate:
         for i in range(args.loop):
             if args.loop > 1:
@@ -171,12 +319,13 @@ def main():
                 print(f"{'='*40}")
 
             # Rearm between runs (and also before the first run) so each simulated stone is measured.
-            arm_server(server_host, http_port)
+            arm_server(http_conn)
             
             simulate_stone_pass(
-                sock, server_addr, 
+                sock,
                 args.tee_hog, args.hog_hog,
-                args.skip_far
+                args.skip_far,
+                args.no_delay
             )
             
             if i < args.loop - 1:
@@ -189,7 +338,9 @@ def main():
         print("  python simulate_triggers.py --simulate --loop 5     # 5 stones")
         print("  python simulate_triggers.py --simulate --skip-far   # Stone that doesn't reach far hog")
         print("  python simulate_triggers.py --device tee            # Single trigger")
+        print("  python simulate_triggers.py --simulate --loop 100 --delay 0.5 --no-delay  # Stress test")
     
+    http_conn.close()
     sock.close()
 
 
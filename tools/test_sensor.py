@@ -5,6 +5,7 @@ Run on the Pi to verify the sensor works.
 """
 
 import argparse
+import signal
 import time
 import sys
 from pathlib import Path
@@ -30,14 +31,21 @@ DEFAULT_CONFIG_PATH = Path(__file__).parent.parent / "config.yaml"
 def load_config(path: Path) -> dict:
     if not path.exists():
         raise FileNotFoundError(f"Config file missing: {path}")
+    # libyaml-backed loader when PyYAML was built with it
     with open(path, "r") as f:
-        return yaml.safe_load(f)
+        return yaml.load(f, Loader=getattr(yaml, 'CSafeLoader', yaml.SafeLoader))
+
+
+def show_state(blocked: bool):
+    status = "□ BLOCKED" if blocked else "■ LIGHT"
+    print(f"\rSensor: {status}  ", end="", flush=True)
 
 
 def on_trigger():
     """Callback when the sensor triggers (beam breaks)."""
     timestamp = time.time_ns()
     print(f"TRIGGER! Time: {timestamp} ns ({time.strftime('%H:%M:%S')})")
+    show_state(True)
 
 
 def main():
@@ -65,16 +73,16 @@ def main():
     # With pull_up=True, Button is considered "pressed" when the pin reads LOW.
     # For LM393-type sensor modules, DO typically goes LOW when the beam is blocked.
     btn = Button(pin, pull_up=True, bounce_time=debounce_s)
+    # The status line is redrawn from the edge callbacks, so nothing polls the pin
     btn.when_pressed = on_trigger
+    btn.when_released = lambda: show_state(False)
 
     print(f"Current state: {'LOW (blocked)' if btn.is_pressed else 'HIGH (light)'}")
     print()
+    show_state(btn.is_pressed)
 
     try:
-        while True:
-            status = "□ BLOCKED" if btn.is_pressed else "■ LIGHT"
-            print(f"\rSensor: {status}  ", end="", flush=True)
-            time.sleep(0.1)
+        signal.pause()
     except KeyboardInterrupt:
         print("\n\nExiting...")
 